@@ -0,0 +1,85 @@
+"""Vectorized adherence analytics over columnar dose data.
+
+Every function takes a frame of resolved (taken or missed) dose counts, as built by
+`doses_frame`, so the work is done in pandas/NumPy passes rather than Python loops.
+"""
+from datetime import date, timedelta
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+ROLLING_WINDOWS = (7, 30, 90)
+
+def doses_frame(dates, time_slots, course_ids, taken, missed) -> pd.DataFrame:
+    """Frame of resolved doses: taken and missed counts per date, slot and course"""
+    return pd.DataFrame({
+        "date": pd.to_datetime(pd.Series(dates, dtype="datetime64[ns]")),
+        "time_slot": pd.Series(time_slots, dtype="category"),
+        "course_id": pd.Series(course_ids, dtype="category"),
+        "taken": np.asarray(taken, dtype=np.int64),
+        "missed": np.asarray(missed, dtype=np.int64),
+    })
+
+def adherence(taken, missed):
+    """Percentage of resolved doses taken, 0 where nothing was resolved (scalars or arrays)"""
+    taken = np.asarray(taken, dtype=float)
+    resolved = taken + np.asarray(missed, dtype=float)
+    return np.round(np.divide(taken * 100, resolved, out=np.zeros_like(resolved), where=resolved > 0), 1)
+
+def daily_counts(doses: pd.DataFrame, first: date, last: date) -> pd.DataFrame:
+    """Taken and missed counts for every day between two dates (inclusive)"""
+    counts = doses.groupby("date")[["taken", "missed"]].sum()
+    return counts.reindex(pd.date_range(first, last, freq="D"), fill_value=0).astype(np.int64)
+
+def streaks(daily: pd.DataFrame) -> Dict[str, int]:
+    """Longest and current runs of days with every resolved dose taken.
+
+    Days without resolved doses neither extend nor break a streak.
+    """
+    active = daily[(daily["taken"] + daily["missed"]) > 0]
+    perfect = (active["missed"] == 0).to_numpy()
+    if not perfect.any():
+        return {"current_streak": 0, "longest_streak": 0}
+    # Every imperfect day starts a new run; count the perfect days of each run
+    runs = np.bincount(np.cumsum(~perfect)[perfect])
+    return {
+        "current_streak": int(runs[-1]) if perfect[-1] else 0,
+        "longest_streak": int(runs.max()),
+    }
+
+def rolling_adherence(daily: pd.DataFrame, windows=ROLLING_WINDOWS) -> Dict[int, np.ndarray]:
+    """Adherence over the trailing `window` days ending on each day of `daily`"""
+    return {
+        window: adherence(
+            daily["taken"].rolling(window, min_periods=1).sum(),
+            daily["missed"].rolling(window, min_periods=1).sum()
+        )
+        for window in windows
+    }
+
+def adherence_by(doses: pd.DataFrame, column: str) -> pd.DataFrame:
+    """Taken, missed and adherence percentage per value of a column"""
+    grouped = doses.groupby(column, observed=True)[["taken", "missed"]].sum()
+    return grouped.assign(adherence_percentage=adherence(grouped["taken"], grouped["missed"]))
+
+def course_trends(doses: pd.DataFrame, today: date, window: int = 30) -> pd.DataFrame:
+    """Per-course adherence overall, over the last `window` days and the `window` days before.
+
+    `trend` is the change in percentage points between the two periods.
+    """
+    recent_start = pd.Timestamp(today - timedelta(days=window - 1))
+    previous_start = recent_start - pd.Timedelta(days=window)
+    overall = adherence_by(doses, "course_id")
+    recent = adherence_by(doses[doses["date"] >= recent_start], "course_id")
+    previous = adherence_by(
+        doses[(doses["date"] >= previous_start) & (doses["date"] < recent_start)], "course_id"
+    )
+    trends = overall.assign(
+        recent_adherence=recent["adherence_percentage"].reindex(overall.index, fill_value=0.0),
+        previous_adherence=previous["adherence_percentage"].reindex(overall.index, fill_value=0.0),
+    )
+    return trends.assign(trend=np.round(trends["recent_adherence"] - trends["previous_adherence"], 1))
+
+def dates_between(first: date, last: date) -> List[str]:
+    return [day.date().isoformat() for day in pd.date_range(first, last, freq="D")]
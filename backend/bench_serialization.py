@@ -0,0 +1,74 @@
+"""Compare FastJSONResponse with FastAPI's default jsonable_encoder + JSONResponse.
+
+Run from the backend directory: `python bench_serialization.py [rows]`. The
+payloads mirror what the schedule, course and analytics routes return; the
+script fails if the two encoders produce different bytes.
+"""
+import os
+import sys
+import timeit
+from datetime import date, datetime, time, timedelta, timezone
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'carelog_bench')
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from server import (
+    Appointment, DailySchedule, FastJSONResponse, PillCourse, PillStatus, TimeSlot
+)
+
+def build_payloads(rows: int) -> dict:
+    course = PillCourse(
+        course_name="Blood Pressure Management",
+        pill_name="Lisinopril 10mg",
+        time_slots=list(TimeSlot),
+        start_date=date.today(),
+        duration_days=365,
+    )
+    statuses = list(PillStatus)
+    schedules = [
+        {
+            "schedule": DailySchedule(
+                course_id=course.id,
+                date=date.today() + timedelta(days=row // 3),
+                time_slot=list(TimeSlot)[row % 3],
+                status=statuses[row % 3],
+                # Naive millisecond timestamps, as MongoDB returns them
+                updated_at=datetime(2025, 1, 1, 8, 30, 15, 123000) + timedelta(minutes=row),
+            ),
+            "course": course,
+        }
+        for row in range(rows)
+    ]
+    appointments = [
+        Appointment(
+            doctor_name=f"Dr. {row}",
+            appointment_date=date.today() + timedelta(days=row),
+            appointment_time=time(9 + row % 8, 30),
+            purpose="Checkup",
+            created_at=datetime.now(timezone.utc),
+        )
+        for row in range(rows)
+    ]
+    return {
+        "schedules": schedules,
+        "courses": [course] * rows,
+        "appointments": appointments,
+        "analytics": {"weekly_adherence": 87.5, "weekly_stats": {"taken": 7, "missed": 1, "total": 8}},
+    }
+
+def main(rows: int = 1000, repeat: int = 20):
+    for name, payload in build_payloads(rows).items():
+        default = lambda: JSONResponse(jsonable_encoder(payload)).body
+        fast = lambda: FastJSONResponse(payload).body
+        if default() != fast():
+            sys.exit(f"{name}: FastJSONResponse output differs from jsonable_encoder + JSONResponse")
+        default_time = timeit.timeit(default, number=repeat) / repeat
+        fast_time = timeit.timeit(fast, number=repeat) / repeat
+        print(f"{name:>12}: default {default_time * 1000:8.2f} ms  "
+              f"fast {fast_time * 1000:8.2f} ms  ({default_time / fast_time:5.1f}x), identical output")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
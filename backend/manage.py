@@ -0,0 +1,50 @@
+"""Offline maintenance commands, e.g. `python manage.py ensure-indexes`"""
+import asyncio
+
+import typer
+
+from server import client, ensure_indexes, migrate_date_storage, rebuild_rollups
+
+cli = typer.Typer()
+
+@cli.callback()
+def main():
+    """CareLog backend maintenance commands"""
+
+@cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Create any missing MongoDB indexes, e.g. before a deploy"""
+    try:
+        built = asyncio.run(ensure_indexes())
+    finally:
+        client.close()
+    
+    for collection, names in built.items():
+        typer.echo(f"{collection}: {', '.join(names) if names else 'up to date'}")
+
+@cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recompute the daily adherence rollups from the stored schedules"""
+    try:
+        days = asyncio.run(rebuild_rollups())
+    finally:
+        client.close()
+    
+    typer.echo(f"Rebuilt rollups for {days} days")
+
+@cli.command("migrate-dates")
+def migrate_dates_command(batch_size: int = typer.Option(1000, help="Documents rewritten per bulk write")):
+    """Convert stored ISO date strings to native BSON dates; safe to rerun if interrupted"""
+    def report(collection, done, total):
+        typer.echo(f"{collection}: {done}/{total}")
+    
+    try:
+        migrated = asyncio.run(migrate_date_storage(batch_size, report))
+    finally:
+        client.close()
+    
+    for collection, count in migrated.items():
+        typer.echo(f"{collection}: migrated {count} documents")
+
+if __name__ == "__main__":
+    cli()
@@ -1,15 +1,31 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import orjson
+from pymongo import ASCENDING, IndexModel, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
 import os
+import time as clock
+import asyncio
+import hashlib
 import logging
+import socket
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, List, Literal, Optional
 import uuid
+import functools
+from collections import Counter, OrderedDict, defaultdict
 from datetime import datetime, date, time, timedelta, timezone
-from enum import Enum
+
+import analytics
+from storage import (
+    LIVE_COURSES, DateStorage, DeletedCourseIds, PillStatus, TimeSlot, create_schedule_storage, decode_date,
+    decode_time, new_course_rollups
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -19,49 +35,106 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Number of daily schedule documents written per insert_many call
+SCHEDULE_INSERT_BATCH_SIZE = int(os.environ.get('SCHEDULE_INSERT_BATCH_SIZE', '500'))
+
+# "materialized" writes one document per dose up front, "virtual" derives
+# pending doses from the course and only persists taken/missed overrides,
+# "bitmap" packs every dose status of a course into one dose_bitmaps document
+SCHEDULE_STORAGE = os.environ.get('SCHEDULE_STORAGE', 'materialized')
+
+# Serve /analytics/overview from the daily_rollups counters; enable once they
+# have been backfilled with `python manage.py rebuild-rollups`
+ANALYTICS_ROLLUPS = os.environ.get('ANALYTICS_ROLLUPS', 'false').lower() == 'true'
+
+# Seconds between background sweeps that mark past pending doses as missed (0 disables)
+AUTO_MARK_MISSED_INTERVAL = int(os.environ.get('AUTO_MARK_MISSED_INTERVAL', '300'))
+
+# Feed /schedules/stream from MongoDB change streams (replica sets only) so
+# events written by other workers reach every subscriber; it follows
+# daily_schedules documents, so it is unavailable with bitmap storage.
+# Without it, events only reach subscribers of the worker that made the change
+SCHEDULE_CHANGE_STREAM = (
+    os.environ.get('SCHEDULE_CHANGE_STREAM', 'false').lower() == 'true' and SCHEDULE_STORAGE != "bitmap"
+)
+
+# Seconds between keep-alive comments on idle event streams
+SSE_HEARTBEAT_INTERVAL = int(os.environ.get('SSE_HEARTBEAT_INTERVAL', '15'))
+
+# Seconds between passes of the reaper that removes soft-deleted courses and
+# their schedules (0 disables), documents deleted per batch and the pause in
+# seconds between batches
+COURSE_REAPER_INTERVAL = int(os.environ.get('COURSE_REAPER_INTERVAL', '60'))
+COURSE_REAPER_BATCH_SIZE = int(os.environ.get('COURSE_REAPER_BATCH_SIZE', '500'))
+COURSE_REAPER_BATCH_DELAY = float(os.environ.get('COURSE_REAPER_BATCH_DELAY', '0.1'))
+
+# Seconds a worker reuses its list of soft-deleted course ids before reloading
+# it, which bounds how long it still counts schedules of courses deleted by
+# another worker
+DELETED_COURSES_REFRESH = int(os.environ.get('DELETED_COURSES_REFRESH', '30'))
+
+# How dates and times are stored: "iso" (ISO strings), "native" (BSON datetimes
+# and seconds-of-day integers) or "migrating" (writes native values while queries
+# match both, for use while `python manage.py migrate-dates` runs)
+DATE_STORAGE = os.environ.get('DATE_STORAGE', 'iso')
+
+# Course cache: "memory" (per-process LRU), "shm" (JSON files on a tmpfs shared
+# by every worker on the host) or "none". Both backends hold at most
+# COURSE_CACHE_SIZE courses for COURSE_CACHE_TTL seconds. A deleted course
+# leaves the deleting worker's cache at once; with several workers, the others
+# keep serving it until they reload their deleted ids (DELETED_COURSES_REFRESH)
+COURSE_CACHE_BACKEND = os.environ.get('COURSE_CACHE_BACKEND', 'memory')
+COURSE_CACHE_SIZE = int(os.environ.get('COURSE_CACHE_SIZE', '1024'))
+COURSE_CACHE_TTL = int(os.environ.get('COURSE_CACHE_TTL', '300'))
+COURSE_CACHE_DIR = os.environ.get('COURSE_CACHE_DIR', '/dev/shm/carelog-course-cache')
+
+# Identifies this process when competing for background job leases
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# JSON serialization
+def encode_json_default(value):
+    if isinstance(value, BaseModel):
+        return dict(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps_json(content) -> bytes:
+    """Serialize with orjson, which handles date, time, datetime and str enums
+    natively, producing the same bytes as FastAPI's jsonable_encoder + JSONResponse"""
+    return orjson.dumps(content, default=encode_json_default, option=orjson.OPT_UTC_Z)
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson; accepts models as well as plain data.
+    
+    Returning it directly from a route with a response_model skips FastAPI's
+    re-validation of the content, while the response_model still documents the schema.
+    """
+    
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+class FastJSONRoute(APIRoute):
+    """Route whose unvalidated results go straight to FastJSONResponse.
+    
+    Without a response_model FastAPI would otherwise walk the whole result with
+    jsonable_encoder before rendering it.
+    """
+    
+    def __init__(self, path: str, endpoint, **kwargs):
+        if kwargs.get("response_model") is None:
+            original = endpoint
+            
+            @functools.wraps(original)
+            async def endpoint(*args, **kwargs):
+                result = await original(*args, **kwargs)
+                return result if isinstance(result, Response) else FastJSONResponse(result)
+        
+        super().__init__(path, endpoint, **kwargs)
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
-
-# Enums
-class TimeSlot(str, Enum):
-    MORNING = "Morning"
-    AFTERNOON = "Afternoon"
-    NIGHT = "Night"
-
-class PillStatus(str, Enum):
-    PENDING = "pending"
-    TAKEN = "taken"
-    MISSED = "missed"
-
-# Helper functions for date/time serialization
-def prepare_for_mongo(data):
-    if isinstance(data.get('start_date'), date):
-        data['start_date'] = data['start_date'].isoformat()
-    if isinstance(data.get('date'), date):
-        data['date'] = data['date'].isoformat()
-    if isinstance(data.get('time'), time):
-        data['time'] = data['time'].strftime('%H:%M:%S')
-    if isinstance(data.get('appointment_date'), date):
-        data['appointment_date'] = data['appointment_date'].isoformat()
-    if isinstance(data.get('appointment_time'), time):
-        data['appointment_time'] = data['appointment_time'].strftime('%H:%M:%S')
-    return data
-
-def parse_from_mongo(item):
-    if isinstance(item.get('start_date'), str):
-        item['start_date'] = datetime.fromisoformat(item['start_date']).date()
-    if isinstance(item.get('date'), str):
-        item['date'] = datetime.fromisoformat(item['date']).date()
-    if isinstance(item.get('time'), str):
-        item['time'] = datetime.strptime(item['time'], '%H:%M:%S').time()
-    if isinstance(item.get('appointment_date'), str):
-        item['appointment_date'] = datetime.fromisoformat(item['appointment_date']).date()
-    if isinstance(item.get('appointment_time'), str):
-        item['appointment_time'] = datetime.strptime(item['appointment_time'], '%H:%M:%S').time()
-    return item
+api_router = APIRouter(prefix="/api", route_class=FastJSONRoute, default_response_class=FastJSONResponse)
 
 # Models
 class PillCourse(BaseModel):
@@ -79,6 +152,14 @@ class PillCourseCreate(BaseModel):
     time_slots: List[TimeSlot]
     start_date: date
     duration_days: int
+    
+    @field_validator("time_slots")
+    @classmethod
+    def check_time_slots_unique(cls, time_slots: List[TimeSlot]) -> List[TimeSlot]:
+        # A dose is identified by its course, day and slot, so a slot can only be taken once a day
+        if len(set(time_slots)) != len(time_slots):
+            raise ValueError("time_slots must not contain duplicates")
+        return time_slots
 
 class DailySchedule(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -91,6 +172,18 @@ class DailySchedule(BaseModel):
 class DailyScheduleUpdate(BaseModel):
     status: PillStatus
 
+class DailyScheduleBulkItem(BaseModel):
+    id: str
+    status: PillStatus
+
+class DailyScheduleBulkUpdate(BaseModel):
+    # Either explicit updates, or one status for every dose on a date (optionally one slot)
+    updates: List[DailyScheduleBulkItem] = []
+    status: Optional[PillStatus] = None
+    time_slot: Optional[TimeSlot] = None
+    # Aliased because a field named `date` would shadow the type in its annotation
+    on_date: Optional[date] = Field(None, alias="date")
+
 class Appointment(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     doctor_name: str
@@ -111,6 +204,725 @@ class AppointmentCreate(BaseModel):
 class AppointmentUpdate(BaseModel):
     completed: bool
 
+class BatchRequest(BaseModel):
+    method: Literal["GET", "PUT"]
+    # Path below /api, optionally with a query string, e.g. "/courses/{id}/progress"
+    path: str
+    body: Optional[Any] = None
+
+# MongoDB codecs
+date_storage = DateStorage(DATE_STORAGE)
+
+def parse_date_param(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date")
+
+FIELD_CODECS = {
+    # field type: (to MongoDB, from MongoDB)
+    date: (date_storage.encode_date, decode_date),
+    time: (date_storage.encode_time, decode_time),
+}
+
+class MongoCodec:
+    """Converts a model's documents to and from their MongoDB representation.
+    
+    The fields needing conversion are resolved once from the model's schema, so
+    encoding and decoding only touch those fields.
+    """
+    
+    def __init__(self, model):
+        self.model = model
+        self.fields = [
+            (name, *FIELD_CODECS[field.annotation])
+            for name, field in model.model_fields.items()
+            if field.annotation in FIELD_CODECS
+        ]
+    
+    def encode(self, data: dict) -> dict:
+        for name, encode, _ in self.fields:
+            if data.get(name) is not None:
+                data[name] = encode(data[name])
+        return data
+    
+    def decode(self, document: dict) -> dict:
+        for name, _, decode in self.fields:
+            if document.get(name) is not None:
+                document[name] = decode(document[name])
+        return document
+    
+    def construct(self, document: dict):
+        """Build the model from a trusted stored document without validating it"""
+        return self.model.model_construct(**self.decode(document))
+
+course_codec = MongoCodec(PillCourse)
+schedule_codec = MongoCodec(DailySchedule)
+appointment_codec = MongoCodec(Appointment)
+
+# Indexes backing the queries issued by the routes below
+INDEXES = {
+    "pill_courses": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("start_date", ASCENDING)], name="start_date"),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+        IndexModel([("deleted_at", ASCENDING)], sparse=True, name="deleted_at"),
+    ],
+    "daily_schedules": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("date", ASCENDING), ("status", ASCENDING)], name="date_status"),
+        IndexModel([("course_id", ASCENDING), ("status", ASCENDING)], name="course_id_status"),
+    ],
+    "appointments": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("completed", ASCENDING), ("appointment_date", ASCENDING)], name="completed_appointment_date"),
+        IndexModel([("appointment_date", ASCENDING), ("id", ASCENDING)], name="appointment_date_id"),
+    ],
+    "daily_rollups": [
+        IndexModel([("date", ASCENDING)], unique=True, name="date_unique"),
+    ],
+    "dose_bitmaps": [
+        IndexModel([("course_id", ASCENDING)], unique=True, name="course_id_unique"),
+    ],
+}
+
+async def ensure_indexes() -> dict:
+    """Create any missing indexes and return the names built per collection"""
+    built = {}
+    for collection, indexes in INDEXES.items():
+        existing = await db[collection].index_information()
+        missing = [index for index in indexes if index.document["name"] not in existing]
+        if missing:
+            await db[collection].create_indexes(missing)
+        built[collection] = [index.document["name"] for index in missing]
+    return built
+
+# Soft-deleted courses
+deleted_courses = DeletedCourseIds(db, DELETED_COURSES_REFRESH)
+
+# Course cache
+class MemoryCacheBackend:
+    """Per-process LRU of courses whose entries expire after a TTL"""
+    
+    def __init__(self, size: int, ttl: int):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+    
+    def get(self, key: str) -> Optional[PillCourse]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, course = entry
+        if expires_at < clock.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return course
+    
+    def set(self, key: str, course: PillCourse):
+        self.entries[key] = (clock.monotonic() + self.ttl, course)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+    
+    def prune(self):
+        # set already keeps the LRU within size
+        pass
+    
+    def delete(self, key: str):
+        self.entries.pop(key, None)
+    
+    def __len__(self):
+        return len(self.entries)
+
+class SharedMemoryCacheBackend:
+    """Courses stored as JSON files on a tmpfs such as /dev/shm, shared by all workers on a host.
+    
+    CourseCache prunes after each batch of writes: once the directory holds more
+    than `size` files, expired files and then the oldest ones are removed, so the
+    directory (which lives in RAM) stays bounded.
+    """
+    
+    def __init__(self, directory: str, size: int, ttl: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.size = size
+        self.ttl = ttl
+    
+    def path(self, key: str) -> Path:
+        # Hash the key so ids taken from URLs can never escape the directory
+        return self.directory / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+    
+    def get(self, key: str) -> Optional[PillCourse]:
+        path = self.path(key)
+        try:
+            if clock.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            return PillCourse.model_validate_json(path.read_bytes())
+        except (OSError, ValueError):
+            return None
+    
+    def set(self, key: str, course: PillCourse):
+        path = self.path(key)
+        staging = path.with_suffix(f".{os.getpid()}.tmp")
+        staging.write_text(course.model_dump_json())
+        os.replace(staging, path)
+    
+    def prune(self):
+        files = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")]
+        # Only stat the files once over capacity; expired files are otherwise dropped on read
+        if len(files) <= self.size:
+            return
+        entries = []
+        for entry in files:
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                continue
+        entries.sort()
+        excess = len(entries) - self.size
+        now = clock.time()
+        for index, (modified_at, path) in enumerate(entries):
+            if index >= excess and now - modified_at <= self.ttl:
+                break
+            Path(path).unlink(missing_ok=True)
+    
+    def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+    
+    def __len__(self):
+        return sum(1 for _ in self.directory.glob("*.json"))
+
+class NullCacheBackend:
+    """Disables caching: every lookup goes to MongoDB"""
+    
+    def get(self, key: str) -> Optional[PillCourse]:
+        return None
+    
+    def set(self, key: str, course: PillCourse):
+        pass
+    
+    def prune(self):
+        pass
+    
+    def delete(self, key: str):
+        pass
+    
+    def __len__(self):
+        return 0
+
+class CourseCache:
+    """Read-through cache of parsed courses, which never change after creation"""
+    
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+    
+    async def get_many(self, course_ids: List[str]) -> Dict[str, PillCourse]:
+        """Cached courses by id, loading every miss with a single $in query"""
+        courses = {}
+        missing = []
+        deleted = await deleted_courses.get()
+        for course_id in course_ids:
+            if course_id in deleted:
+                continue
+            course = self.backend.get(course_id)
+            if course is None:
+                missing.append(course_id)
+            else:
+                courses[course_id] = course
+        self.hits += len(courses)
+        self.misses += len(missing)
+        
+        if missing:
+            async for document in db.pill_courses.find({"id": {"$in": missing}, **LIVE_COURSES}):
+                course = PillCourse(**course_codec.decode(document))
+                self.backend.set(course.id, course)
+                courses[course.id] = course
+            self.backend.prune()
+        return courses
+    
+    async def get(self, course_id: str) -> Optional[PillCourse]:
+        courses = await self.get_many([course_id])
+        return courses.get(course_id)
+    
+    def put(self, course: PillCourse):
+        self.backend.set(course.id, course)
+        self.backend.prune()
+    
+    def invalidate(self, course_id: str):
+        self.backend.delete(course_id)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0
+        }
+
+def create_course_cache_backend():
+    if COURSE_CACHE_BACKEND == "shm":
+        return SharedMemoryCacheBackend(COURSE_CACHE_DIR, COURSE_CACHE_SIZE, COURSE_CACHE_TTL)
+    if COURSE_CACHE_BACKEND == "none":
+        return NullCacheBackend()
+    return MemoryCacheBackend(COURSE_CACHE_SIZE, COURSE_CACHE_TTL)
+
+course_cache = CourseCache(create_course_cache_backend())
+
+# Keyset pagination
+async def paginate(collection, codec: MongoCodec, sort_field: str, after: Optional[str] = None,
+                   limit: Optional[int] = None, stream: bool = False, query: Optional[dict] = None):
+    """List documents matching `query` in (sort_field, id) order, starting after the document with id `after`.
+    
+    A full page sets the X-Next-Cursor header to the id to pass as `after` for the
+    next page. With `stream`, models are written as NDJSON while the cursor yields them.
+    """
+    query = dict(query or {})
+    anchor = None
+    if after is not None:
+        anchor = await collection.find_one({"id": after}, projection={sort_field: True})
+        if anchor is None:
+            raise HTTPException(status_code=400, detail="Unknown cursor")
+    
+    if date_storage.mode == "migrating":
+        documents = find_mixed_date_page(collection, query, sort_field, anchor and anchor.get(sort_field), after, limit)
+    else:
+        if anchor is not None:
+            query["$or"] = [
+                {sort_field: {"$gt": anchor[sort_field]}},
+                {sort_field: anchor[sort_field], "id": {"$gt": after}}
+            ]
+        documents = collection.find(query).sort([(sort_field, ASCENDING), ("id", ASCENDING)])
+        if limit is not None:
+            documents = documents.limit(limit)
+    
+    if stream:
+        async def lines():
+            async for document in documents:
+                yield dumps_json(codec.construct(document)) + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    items = [codec.construct(document) async for document in documents]
+    headers = {}
+    if limit is not None and len(items) == limit:
+        headers["X-Next-Cursor"] = items[-1].id
+    return FastJSONResponse(items, headers=headers)
+
+async def find_mixed_date_page(collection, query: dict, sort_field: str, anchor_value, after: Optional[str],
+                               limit: Optional[int]):
+    """Yield a page in (sort_field, id) order while a date field holds both ISO strings and native dates.
+    
+    MongoDB sorts every string before every date and compares values of one type
+    only, so each representation is paged with the anchor converted to it, and the
+    two pages are merged by date.
+    """
+    if isinstance(anchor_value, str):
+        anchors = {"string": anchor_value, "date": datetime.fromisoformat(anchor_value)}
+    elif anchor_value is not None:
+        anchors = {"string": decode_date(anchor_value).isoformat(), "date": anchor_value}
+    else:
+        anchors = {"string": None, "date": None}
+    
+    documents = []
+    for bson_type, value in anchors.items():
+        conditions = [query, {sort_field: {"$type": bson_type}}]
+        if value is not None:
+            conditions.append({"$or": [{sort_field: {"$gt": value}}, {sort_field: value, "id": {"$gt": after}}]})
+        cursor = collection.find({"$and": conditions}).sort([(sort_field, ASCENDING), ("id", ASCENDING)])
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        documents += await cursor.to_list(None)
+    
+    documents.sort(key=lambda document: (
+        datetime.fromisoformat(document[sort_field]) if isinstance(document[sort_field], str) else document[sort_field],
+        document["id"]
+    ))
+    for document in documents[:limit]:
+        yield document
+
+# Schedule storage
+async def load_cached_courses(course_ids: List[str]) -> Dict[str, dict]:
+    """Live courses by id as documents for the storage engine, served by the course cache"""
+    return {course_id: course.dict() for course_id, course in (await course_cache.get_many(course_ids)).items()}
+
+schedule_storage = create_schedule_storage(
+    SCHEDULE_STORAGE, db, date_storage, deleted_courses, SCHEDULE_INSERT_BATCH_SIZE, load_cached_courses
+)
+
+async def join_courses(schedules: List[dict]) -> List[dict]:
+    """Pair raw schedules with their courses, loading uncached courses with one $in query"""
+    courses_by_id = await course_cache.get_many(list({schedule["course_id"] for schedule in schedules}))
+    
+    result = []
+    for schedule in schedules:
+        course_obj = courses_by_id.get(schedule["course_id"])
+        if course_obj:
+            result.append({
+                "schedule": DailySchedule(**schedule_codec.decode(schedule)),
+                "course": course_obj
+            })
+    return result
+
+async def compute_courses_progress(course_ids: List[str]) -> List[dict]:
+    """Build the progress summary of each course, in the order given"""
+    counts = await schedule_storage.count_doses(course_ids)
+    
+    result = []
+    for course_id in course_ids:
+        taken_pills = counts[course_id]["taken"]
+        missed_pills = counts[course_id]["missed"]
+        pending_pills = counts[course_id]["pending"]
+        total_pills = taken_pills + missed_pills + pending_pills
+        
+        progress_percentage = (taken_pills / total_pills * 100) if total_pills > 0 else 0
+        adherence_percentage = (taken_pills / (taken_pills + missed_pills) * 100) if (taken_pills + missed_pills) > 0 else 0
+        
+        result.append({
+            "course_id": course_id,
+            "total_pills": total_pills,
+            "taken_pills": taken_pills,
+            "missed_pills": missed_pills,
+            "pending_pills": pending_pills,
+            "progress_percentage": round(progress_percentage, 1),
+            "adherence_percentage": round(adherence_percentage, 1)
+        })
+    return result
+
+async def find_schedules(first: date, last: Optional[date] = None, status: Optional[str] = None,
+                         course_id: Optional[str] = None, courses: Optional[List[dict]] = None) -> List[dict]:
+    """Load the raw schedule documents due between two dates (inclusive), or on one date.
+    
+    Derived storage modes reuse `courses`, the raw live courses, when the caller already loaded them.
+    """
+    return await schedule_storage.find_schedules(first, last or first, status, course_id, courses)
+
+async def record_status_changes(changes: List[tuple]):
+    """Update rollups and subscribers after doses changed status, given (schedule, previous status) pairs"""
+    deltas = defaultdict(Counter)
+    reset_through = {}
+    for schedule, previous_status in changes:
+        for day, counts in status_change(schedule["date"], previous_status, schedule["status"]).items():
+            deltas[day].update(counts)
+        if schedule["status"] == PillStatus.PENDING.value and previous_status != PillStatus.PENDING.value:
+            day = decode_date(schedule["date"])
+            reset_through[schedule["course_id"]] = min(day, reset_through.get(schedule["course_id"], day))
+    
+    await bump_rollups(deltas)
+    await announce_status_changes([schedule for schedule, _ in changes])
+    for course_id, day in reset_through.items():
+        # Let the next missed sweep revisit these doses
+        await db.pill_courses.update_one(
+            {"id": course_id, "missed_through": {"$exists": True}},
+            {"$min": {"missed_through": date_storage.encode_date(day)}}
+        )
+
+# Bulk status updates
+# Every write is guarded by the state read just before it, so a dose changed
+# concurrently is reported as a "conflict" instead of being overwritten
+async def set_schedule_statuses(updates: Dict[str, PillStatus]) -> Dict[str, str]:
+    """Apply many status updates with one bulk_write; returns {id: result} where a
+    result is "updated", "unchanged", "not_found" or "conflict"
+    """
+    results = {schedule_id: "not_found" for schedule_id in updates}
+    changes = await schedule_storage.set_statuses(updates, results)
+    await record_status_changes(changes)
+    return results
+
+# Daily adherence rollups
+def status_change(day, old_status: str, new_status: str) -> dict:
+    """Rollup delta for one dose moving between statuses"""
+    if old_status == new_status:
+        return {}
+    return {day: Counter({old_status: -1, new_status: 1})}
+
+async def bump_rollups(deltas: dict, sign: int = 1):
+    """Apply per-day status deltas ({date: Counter}) to the daily_rollups counters.
+    
+    Rollups are always keyed by ISO date strings, whatever DATE_STORAGE is.
+    """
+    operations = []
+    for day, counts in deltas.items():
+        increments = {status: sign * count for status, count in counts.items() if count}
+        if increments:
+            operations.append(UpdateOne({"date": decode_date(day).isoformat()}, {"$inc": increments}, upsert=True))
+    if operations:
+        await db.daily_rollups.bulk_write(operations, ordered=False)
+
+async def rebuild_rollups() -> int:
+    """Recompute every daily_rollups document from the stored courses and schedules"""
+    totals = defaultdict(Counter)
+    # Deleted courses still count until the reaper takes them out
+    async for course in db.pill_courses.find({"rollups_removed": {"$exists": False}}):
+        for day, counts in (await schedule_storage.course_rollups(course)).items():
+            totals[day].update(counts)
+    
+    # Replace each day in place rather than clearing the collection, so
+    # bump_rollups upserts landing meanwhile never hit a missing or duplicate date
+    operations = [
+        ReplaceOne({"date": day}, {"date": day, **{status.value: counts[status.value] for status in PillStatus}}, upsert=True)
+        for day, counts in sorted(totals.items())
+    ]
+    if operations:
+        await db.daily_rollups.bulk_write(operations, ordered=False)
+    await db.daily_rollups.delete_many({"date": {"$nin": list(totals)}})
+    return len(operations)
+
+# Date storage migration
+def native_date(value: str) -> datetime:
+    day = date.fromisoformat(value)
+    return datetime(day.year, day.month, day.day)
+
+def native_time(value: str) -> int:
+    parsed = time.fromisoformat(value)
+    return parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+# collection: {field: converter from the ISO string form to the native form}
+DATE_FIELDS = {
+    "pill_courses": {"start_date": native_date, "missed_through": native_date, "end_date": native_date},
+    "daily_schedules": {"date": native_date, "updated_at": datetime.fromisoformat, "swept_at": datetime.fromisoformat},
+    "appointments": {"appointment_date": native_date, "appointment_time": native_time},
+}
+
+async def migrate_date_storage(batch_size: int = 1000, progress=None) -> dict:
+    """Rewrite ISO string dates and times as BSON datetimes and seconds-of-day.
+    
+    Only documents still holding a string field are selected, so the migration can be
+    interrupted and rerun. Run it with DATE_STORAGE=migrating, then switch to native.
+    `progress(collection, done, total)` is called after every batch.
+    """
+    migrated = {}
+    for name, fields in DATE_FIELDS.items():
+        collection = db[name]
+        query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        total = await collection.count_documents(query)
+        done = 0
+        last_id = None
+        while True:
+            batch_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+            documents = await collection.find(
+                batch_query, projection=list(fields)
+            ).sort("_id", ASCENDING).limit(batch_size).to_list(None)
+            if not documents:
+                break
+            # Match each field on the string read, so a value written since is left alone
+            operations = [
+                UpdateOne({"_id": document["_id"], field: document[field]}, {"$set": {field: convert(document[field])}})
+                for document in documents
+                for field, convert in fields.items()
+                if isinstance(document.get(field), str)
+            ]
+            await collection.bulk_write(operations, ordered=False)
+            done += len(documents)
+            last_id = documents[-1]["_id"]
+            if progress:
+                progress(name, done, total)
+        migrated[name] = done
+    return migrated
+
+# Missed dose sweeper
+# Serializes the background and manual sweeps of this worker, which share one lease
+missed_sweep_lock = asyncio.Lock()
+
+async def sweep_missed_schedules(before: date) -> dict:
+    """Mark pending doses before a date as missed, counting each write into the rollups; returns {date: count}"""
+    swept = Counter()
+    async for marked in schedule_storage.mark_missed(before):
+        await bump_rollups({day: Counter(pending=-count, missed=count) for day, count in marked.items()})
+        swept.update(marked)
+    return dict(swept)
+
+async def run_missed_sweep() -> dict:
+    """Sweep missed doses up to today and record the run's stats on the job document"""
+    async with missed_sweep_lock:
+        started_at = datetime.now(timezone.utc)
+        swept = await sweep_missed_schedules(date.today())
+    stats = {
+        "worker": WORKER_ID,
+        "started_at": started_at,
+        "finished_at": datetime.now(timezone.utc),
+        "updated_count": sum(swept.values()),
+        "dates": swept
+    }
+    await db.scheduler_jobs.update_one({"_id": "auto-mark-missed"}, {"$set": {"last_run": stats}}, upsert=True)
+    if not SCHEDULE_CHANGE_STREAM:
+        # Otherwise the change stream publishes it from last_run, on every worker
+        publish_missed_sweep(stats)
+    return stats
+
+async def acquire_job_lease(job: str, ttl: int) -> bool:
+    """Take or renew the Mongo lease that elects a single worker to run a background job"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.scheduler_jobs.update_one(
+            {"_id": job, "$or": [
+                {"owner": WORKER_ID},
+                {"lease_expires_at": {"$lt": now}},
+                {"lease_expires_at": {"$exists": False}}
+            ]},
+            {"$set": {"owner": WORKER_ID, "lease_expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+async def missed_sweep_loop():
+    """Periodically sweep missed doses while this worker holds the job lease"""
+    while True:
+        try:
+            if await acquire_job_lease("auto-mark-missed", AUTO_MARK_MISSED_INTERVAL * 2):
+                stats = await run_missed_sweep()
+                if stats["updated_count"]:
+                    logger.info("Marked %d pending pills as missed", stats["updated_count"])
+        except Exception:
+            # Keep sweeping after any failure; only cancellation ends the loop
+            logger.exception("Missed dose sweep failed")
+        await asyncio.sleep(AUTO_MARK_MISSED_INTERVAL)
+
+# Soft-deleted course reaper
+async def reap_course(course_id: str) -> int:
+    """Take a soft-deleted course out of the rollups, then remove its schedules in paced batches and the course itself"""
+    # Flag the course before subtracting so an interrupted reap never subtracts it twice
+    course = await db.pill_courses.find_one_and_update(
+        {"id": course_id, "deleted_at": {"$exists": True}, "rollups_removed": {"$exists": False}},
+        {"$set": {"rollups_removed": True}}
+    )
+    if course:
+        await bump_rollups(await schedule_storage.course_rollups(course), sign=-1)
+    
+    removed = await schedule_storage.remove_course(course_id, COURSE_REAPER_BATCH_SIZE, COURSE_REAPER_BATCH_DELAY)
+    await db.pill_courses.delete_one({"id": course_id, "deleted_at": {"$exists": True}})
+    deleted_courses.discard(course_id)
+    return removed
+
+async def run_course_reaper() -> dict:
+    """Reap every soft-deleted course, oldest first, and record the run's stats on the job document"""
+    started_at = datetime.now(timezone.utc)
+    course_ids = [
+        course["id"] async for course in
+        db.pill_courses.find({"deleted_at": {"$exists": True}}, projection={"id": True}).sort("deleted_at", ASCENDING)
+    ]
+    removed = 0
+    for course_id in course_ids:
+        removed += await reap_course(course_id)
+    stats = {
+        "worker": WORKER_ID,
+        "started_at": started_at,
+        "finished_at": datetime.now(timezone.utc),
+        "courses": len(course_ids),
+        "schedules": removed
+    }
+    await db.scheduler_jobs.update_one({"_id": "reap-courses"}, {"$set": {"last_run": stats}}, upsert=True)
+    return stats
+
+async def course_reaper_loop():
+    """Periodically reap soft-deleted courses while this worker holds the job lease"""
+    while True:
+        try:
+            if await acquire_job_lease("reap-courses", COURSE_REAPER_INTERVAL * 2):
+                stats = await run_course_reaper()
+                if stats["courses"]:
+                    logger.info("Reaped %d deleted courses and %d schedules", stats["courses"], stats["schedules"])
+        except Exception:
+            logger.exception("Course reaper failed")
+        await asyncio.sleep(COURSE_REAPER_INTERVAL)
+
+# Schedule event stream
+schedule_subscribers = set()
+
+def publish_schedule_event(event: str, data):
+    """Fan an event out to every /schedules/stream subscriber of this worker"""
+    for queue in schedule_subscribers:
+        if queue.full() and event == "reminders":
+            # Reminders replace the client's state, so they evict the oldest event rather than being lost
+            queue.get_nowait()
+        try:
+            queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            logger.warning("Dropping %s event for a slow schedule stream subscriber", event)
+
+def publish_missed_sweep(stats: dict):
+    """One missed event summing up a sweep, in place of a status event per dose"""
+    if stats["updated_count"]:
+        publish_schedule_event("missed", {"updated_count": stats["updated_count"], "dates": stats["dates"]})
+
+async def publish_reminders():
+    """Push the current pending reminders, computed once for all subscribers"""
+    if schedule_subscribers:
+        publish_schedule_event("reminders", await get_pending_reminders())
+
+async def broadcast_status_changes(schedules: List[dict]):
+    """Push dose status changes, refreshing reminders once when any is due today"""
+    if not schedule_subscribers:
+        return
+    due_today = False
+    for schedule in schedules:
+        day = decode_date(schedule["date"])
+        publish_schedule_event("status", {
+            "id": schedule["id"],
+            "course_id": schedule["course_id"],
+            "date": day,
+            "time_slot": schedule["time_slot"],
+            "status": schedule["status"]
+        })
+        due_today = due_today or day == date.today()
+    if due_today:
+        await publish_reminders()
+
+async def announce_status_changes(schedules: List[dict]):
+    """Broadcast status changes made by this worker unless the change stream will"""
+    if schedules and not SCHEDULE_CHANGE_STREAM:
+        await broadcast_status_changes(schedules)
+
+async def follow_changes(collection, pipeline: List[dict], handle):
+    """Pass every change of a collection matching `pipeline` to `handle`, reconnecting after failures"""
+    while True:
+        try:
+            async with collection.watch(pipeline, full_document="updateLookup") as stream:
+                async for change in stream:
+                    if change.get("fullDocument"):
+                        await handle(change["fullDocument"])
+        except Exception:
+            logger.exception("Change stream on %s failed, reconnecting", collection.name)
+            await asyncio.sleep(SSE_HEARTBEAT_INTERVAL)
+
+async def watch_schedule_changes():
+    """Broadcast status changes from every worker using a MongoDB change stream.
+    
+    Writes of the missed sweep (marked by `swept_at`) are skipped: the sweep is
+    announced once by watch_missed_sweeps, so it cannot flood subscriber queues.
+    """
+    pipeline = [{"$match": {"$or": [
+        {"operationType": "update", "updateDescription.updatedFields.swept_at": {"$exists": False}},
+        {"operationType": "replace"},
+        {
+            "operationType": "insert",
+            "fullDocument.status": {"$ne": PillStatus.PENDING.value},
+            "fullDocument.swept_at": {"$exists": False}
+        }
+    ]}}]
+    
+    async def broadcast(schedule):
+        await broadcast_status_changes([schedule])
+    await follow_changes(db.daily_schedules, pipeline, broadcast)
+
+async def watch_missed_sweeps():
+    """Publish the missed event of a sweep run by any worker, from its recorded last_run"""
+    pipeline = [{"$match": {"documentKey._id": "auto-mark-missed", "$or": [
+        {"operationType": "update", "updateDescription.updatedFields.last_run": {"$exists": True}},
+        {"operationType": "insert", "fullDocument.last_run": {"$exists": True}}
+    ]}}]
+    
+    async def publish(job):
+        publish_missed_sweep(job["last_run"])
+    await follow_changes(db.scheduler_jobs, pipeline, publish)
+
 # Pill Course Routes
 @api_router.post("/courses", response_model=PillCourse)
 async def create_course(course: PillCourseCreate):
@@ -118,137 +930,219 @@ async def create_course(course: PillCourseCreate):
     course_obj = PillCourse(**course_dict)
     
     # Prepare for MongoDB storage
-    course_data = prepare_for_mongo(course_obj.dict())
+    course_data = course_codec.encode(course_obj.dict())
     await db.pill_courses.insert_one(course_data)
+    course_cache.put(course_obj)
     
-    # Generate daily schedules for this course
-    start_date = course.start_date
-    for day in range(course.duration_days):
-        current_date = start_date + timedelta(days=day)
-        for time_slot in course.time_slots:
-            schedule = DailySchedule(
-                course_id=course_obj.id,
-                date=current_date,
-                time_slot=time_slot
-            )
-            schedule_data = prepare_for_mongo(schedule.dict())
-            await db.daily_schedules.insert_one(schedule_data)
+    # Roll the course back if its doses cannot be written in full
+    try:
+        await schedule_storage.add_course(course_data)
+    except PyMongoError:
+        logger.exception("Failed to generate schedules for course %s", course_obj.id)
+        await db.pill_courses.delete_one({"id": course_obj.id})
+        course_cache.invalidate(course_obj.id)
+        raise HTTPException(status_code=500, detail="Failed to create course schedules")
     
+    await bump_rollups(new_course_rollups(course_data))
+    await publish_reminders()
     return course_obj
 
 @api_router.get("/courses", response_model=List[PillCourse])
-async def get_courses():
-    courses = await db.pill_courses.find().to_list(1000)
-    return [PillCourse(**parse_from_mongo(course)) for course in courses]
+async def get_courses(after: Optional[str] = None,
+                      limit: Optional[int] = Query(None, ge=1, le=1000), stream: bool = False):
+    return await paginate(db.pill_courses, course_codec, "created_at", after, limit, stream, LIVE_COURSES)
+
+@api_router.get("/courses/progress")
+async def get_courses_progress(ids: Optional[str] = None):
+    """Progress of the given comma-separated course ids, or of every course"""
+    if ids:
+        course_ids = list(dict.fromkeys(course_id for course_id in ids.split(",") if course_id))
+    else:
+        course_ids = await db.pill_courses.distinct("id", LIVE_COURSES)
+    return await compute_courses_progress(course_ids)
+
+@api_router.get("/courses/cache/stats")
+async def get_course_cache_stats():
+    """Hit/miss counters of this worker's course cache"""
+    return course_cache.stats()
 
 @api_router.get("/courses/{course_id}", response_model=PillCourse)
 async def get_course(course_id: str):
-    course = await db.pill_courses.find_one({"id": course_id})
+    course = await course_cache.get(course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
-    return PillCourse(**parse_from_mongo(course))
+    return course
+
+@api_router.get("/courses/reaper/status")
+async def get_course_reaper_status():
+    """Reaper configuration, current leader, backlog of deleted data and last run stats"""
+    job = await db.scheduler_jobs.find_one({"_id": "reap-courses"}) or {}
+    deleted = await deleted_courses.load()
+    return {
+        "interval_seconds": COURSE_REAPER_INTERVAL,
+        "batch_size": COURSE_REAPER_BATCH_SIZE,
+        "leader": job.get("owner"),
+        "lease_expires_at": job.get("lease_expires_at"),
+        "backlog": {
+            "courses": len(deleted),
+            "schedules": await schedule_storage.count_stored(deleted)
+        },
+        "last_run": job.get("last_run")
+    }
 
 @api_router.delete("/courses/{course_id}")
 async def delete_course(course_id: str):
-    # Delete course and all related schedules
-    await db.pill_courses.delete_one({"id": course_id})
-    await db.daily_schedules.delete_many({"course_id": course_id})
+    # Tombstone the course; the reaper takes it out of the rollups and removes
+    # it and its schedules in the background
+    result = await db.pill_courses.update_one(
+        {"id": course_id, **LIVE_COURSES},
+        {"$set": {"deleted_at": datetime.now(timezone.utc)}}
+    )
+    if result.modified_count:
+        deleted_courses.add(course_id)
+    course_cache.invalidate(course_id)
+    await publish_reminders()
     return {"message": "Course deleted successfully"}
 
 # Daily Schedule Routes
 @api_router.get("/schedules/today")
 async def get_today_schedules():
     today = date.today()
-    schedules = await db.daily_schedules.find({"date": today.isoformat()}).to_list(1000)
+    schedules = await find_schedules(today)
     
-    # Get course details for each schedule
-    result = []
-    for schedule in schedules:
-        course = await db.pill_courses.find_one({"id": schedule["course_id"]})
-        if course:
-            schedule_obj = DailySchedule(**parse_from_mongo(schedule))
-            course_obj = PillCourse(**parse_from_mongo(course))
-            result.append({
-                "schedule": schedule_obj,
-                "course": course_obj
-            })
+    return await join_courses(schedules)
+
+@api_router.get("/schedules/stream")
+async def stream_schedule_events(request: Request):
+    """Server-Sent Events: a reminders snapshot, then status, missed and reminders updates"""
+    queue = asyncio.Queue(maxsize=100)
+    schedule_subscribers.add(queue)
     
-    return result
+    async def events():
+        try:
+            event, data = "reminders", await get_pending_reminders()
+            while True:
+                yield f"event: {event}\ndata: {dumps_json(data).decode()}\n\n"
+                while True:
+                    if await request.is_disconnected():
+                        return
+                    try:
+                        event, data = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_INTERVAL)
+                        break
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+        finally:
+            schedule_subscribers.discard(queue)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+# Longest period GET /schedules serves in one request
+MAX_SCHEDULE_RANGE_DAYS = 92
+
+@api_router.get("/schedules")
+async def get_schedules_in_range(from_date: str = Query(..., alias="from"), to_date: str = Query(..., alias="to"),
+                                 status: Optional[PillStatus] = None, course_id: Optional[str] = None):
+    """Schedules between two dates (inclusive) grouped by date, e.g. for a month calendar"""
+    first, last = parse_date_param(from_date), parse_date_param(to_date)
+    if not 0 <= (last - first).days < MAX_SCHEDULE_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must span 1 to {MAX_SCHEDULE_RANGE_DAYS} days")
+    schedules = await find_schedules(first, last, status.value if status else None, course_id)
+    
+    grouped = {(first + timedelta(days=day)).isoformat(): [] for day in range((last - first).days + 1)}
+    for item in await join_courses(schedules):
+        grouped[item["schedule"].date.isoformat()].append(item)
+    return grouped
 
 @api_router.get("/schedules/date/{target_date}")
 async def get_schedules_by_date(target_date: str):
-    schedules = await db.daily_schedules.find({"date": target_date}).to_list(1000)
-    
-    result = []
-    for schedule in schedules:
-        course = await db.pill_courses.find_one({"id": schedule["course_id"]})
-        if course:
-            schedule_obj = DailySchedule(**parse_from_mongo(schedule))
-            course_obj = PillCourse(**parse_from_mongo(course))
-            result.append({
-                "schedule": schedule_obj,
-                "course": course_obj
-            })
+    schedules = await find_schedules(parse_date_param(target_date))
     
-    return result
+    return await join_courses(schedules)
+
+async def set_schedule_status(schedule_id: str, status: PillStatus) -> bool:
+    """Set the status of a dose in the configured storage; False if it does not exist"""
+    change = await schedule_storage.set_status(schedule_id, status)
+    if change is None:
+        return False
+    await record_status_changes([change])
+    return True
 
 @api_router.put("/schedules/{schedule_id}")
 async def update_schedule_status(schedule_id: str, update: DailyScheduleUpdate):
-    result = await db.daily_schedules.update_one(
-        {"id": schedule_id},
-        {"$set": {"status": update.status, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
-    if result.matched_count == 0:
+    if not await set_schedule_status(schedule_id, update.status):
         raise HTTPException(status_code=404, detail="Schedule not found")
     return {"message": "Schedule updated successfully"}
 
-@api_router.get("/courses/{course_id}/progress")
-async def get_course_progress(course_id: str):
-    # Get all schedules for this course
-    schedules = await db.daily_schedules.find({"course_id": course_id}).to_list(1000)
-    
-    total_pills = len(schedules)
-    taken_pills = len([s for s in schedules if s["status"] == "taken"])
-    missed_pills = len([s for s in schedules if s["status"] == "missed"])
-    pending_pills = len([s for s in schedules if s["status"] == "pending"])
-    
-    progress_percentage = (taken_pills / total_pills * 100) if total_pills > 0 else 0
-    adherence_percentage = (taken_pills / (taken_pills + missed_pills) * 100) if (taken_pills + missed_pills) > 0 else 0
+@api_router.patch("/schedules")
+async def bulk_update_schedule_status(update: DailyScheduleBulkUpdate):
+    """Update many doses at once, by id or by date (and optionally slot), with per-dose results"""
+    if update.updates and update.on_date is None:
+        statuses = {item.id: item.status for item in update.updates}
+    elif update.on_date is not None and update.status is not None and not update.updates:
+        schedules = await find_schedules(update.on_date)
+        statuses = {
+            schedule["id"]: update.status for schedule in schedules
+            if update.time_slot is None or schedule["time_slot"] == update.time_slot.value
+        }
+    else:
+        raise HTTPException(status_code=400, detail="Provide either updates or a date and status")
     
+    results = await set_schedule_statuses(statuses)
     return {
-        "course_id": course_id,
-        "total_pills": total_pills,
-        "taken_pills": taken_pills,
-        "missed_pills": missed_pills,
-        "pending_pills": pending_pills,
-        "progress_percentage": round(progress_percentage, 1),
-        "adherence_percentage": round(adherence_percentage, 1)
+        "updated_count": sum(result == "updated" for result in results.values()),
+        "results": [
+            {"id": schedule_id, "status": statuses[schedule_id], "result": result}
+            for schedule_id, result in results.items()
+        ]
     }
 
+@api_router.put("/courses/{course_id}/doses/{target_date}/{time_slot}")
+async def update_dose_status(course_id: str, target_date: str, time_slot: TimeSlot, update: DailyScheduleUpdate):
+    """Set a dose's status by its natural key; the id is derived from the cached course"""
+    course = await course_cache.get(course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    target = parse_date_param(target_date)
+    change = await schedule_storage.set_dose_status(
+        course.dict(), (target - course.start_date).days, time_slot, update.status
+    )
+    if change is None:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    await record_status_changes([change])
+    return {"message": "Schedule updated successfully"}
+
+@api_router.get("/courses/{course_id}/progress")
+async def get_course_progress(course_id: str):
+    progress = await compute_courses_progress([course_id])
+    return progress[0]
+
 # Appointment Routes
 @api_router.post("/appointments", response_model=Appointment)
 async def create_appointment(appointment: AppointmentCreate):
     appointment_dict = appointment.dict()
     appointment_obj = Appointment(**appointment_dict)
     
-    appointment_data = prepare_for_mongo(appointment_obj.dict())
+    appointment_data = appointment_codec.encode(appointment_obj.dict())
     await db.appointments.insert_one(appointment_data)
     
     return appointment_obj
 
 @api_router.get("/appointments", response_model=List[Appointment])
-async def get_appointments():
-    appointments = await db.appointments.find().sort("appointment_date", 1).to_list(1000)
-    return [Appointment(**parse_from_mongo(appointment)) for appointment in appointments]
+async def get_appointments(after: Optional[str] = None,
+                           limit: Optional[int] = Query(None, ge=1, le=1000), stream: bool = False):
+    return await paginate(db.appointments, appointment_codec, "appointment_date", after, limit, stream)
 
-@api_router.get("/appointments/upcoming")
+@api_router.get("/appointments/upcoming", response_model=List[Appointment])
 async def get_upcoming_appointments():
     today = date.today()
     appointments = await db.appointments.find({
-        "appointment_date": {"$gte": today.isoformat()},
+        **date_storage.match("appointment_date", "$gte", today),
         "completed": False
     }).sort("appointment_date", 1).to_list(100)
-    return [Appointment(**parse_from_mongo(appointment)) for appointment in appointments]
+    return FastJSONResponse([appointment_codec.construct(appointment) for appointment in appointments])
 
 @api_router.put("/appointments/{appointment_id}")
 async def update_appointment(appointment_id: str, update: AppointmentUpdate):
@@ -271,86 +1165,77 @@ async def delete_appointment(appointment_id: str):
 @api_router.post("/schedules/auto-mark-missed")
 async def auto_mark_missed_pills():
     """Mark all pending pills from previous days as missed"""
-    today = date.today()
-    yesterday = today - timedelta(days=1)
-    
-    # Find all pending schedules from before today
-    result = await db.daily_schedules.update_many(
-        {
-            "date": {"$lt": today.isoformat()},
-            "status": "pending"
-        },
-        {
-            "$set": {
-                "status": "missed", 
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }
-        }
-    )
+    if not await acquire_job_lease("auto-mark-missed", AUTO_MARK_MISSED_INTERVAL * 2):
+        raise HTTPException(status_code=409, detail="The missed dose sweep is run by another worker")
+    stats = await run_missed_sweep()
     
     return {
-        "message": f"Marked {result.modified_count} pending pills as missed",
-        "updated_count": result.modified_count
+        "message": f"Marked {stats['updated_count']} pending pills as missed",
+        "updated_count": stats["updated_count"]
+    }
+
+@api_router.get("/schedules/auto-mark-missed/status")
+async def get_auto_mark_missed_status():
+    """Background sweeper configuration, current leader and last run stats"""
+    job = await db.scheduler_jobs.find_one({"_id": "auto-mark-missed"}) or {}
+    return {
+        "interval_seconds": AUTO_MARK_MISSED_INTERVAL,
+        "leader": job.get("owner"),
+        "lease_expires_at": job.get("lease_expires_at"),
+        "last_run": job.get("last_run")
     }
 
 @api_router.get("/schedules/pending-reminders")
 async def get_pending_reminders():
     """Get all pending pills for today that need reminders"""
     today = date.today()
-    schedules = await db.daily_schedules.find({
-        "date": today.isoformat(),
-        "status": "pending"
-    }).to_list(1000)
-    
-    result = []
-    for schedule in schedules:
-        course = await db.pill_courses.find_one({"id": schedule["course_id"]})
-        if course:
-            schedule_obj = DailySchedule(**parse_from_mongo(schedule))
-            course_obj = PillCourse(**parse_from_mongo(course))
-            result.append({
-                "schedule": schedule_obj,
-                "course": course_obj
-            })
+    schedules = await find_schedules(today, status=PillStatus.PENDING.value)
     
-    return result
+    return await join_courses(schedules)
 
 # Analytics Routes
+async def adherence_from_rollups(week_ago: date, month_ago: date, today: date):
+    """Weekly and monthly {status: count} from at most 31 daily_rollups documents"""
+    rollups = await db.daily_rollups.find({
+        "date": {"$gte": month_ago.isoformat(), "$lte": today.isoformat()}
+    }).to_list(None)
+    weekly, monthly = Counter(), Counter()
+    for rollup in rollups:
+        counts = {status: rollup.get(status, 0) for status in ("taken", "missed")}
+        monthly.update(counts)
+        if rollup["date"] >= week_ago.isoformat():
+            weekly.update(counts)
+    return weekly, monthly
+
 @api_router.get("/analytics/overview")
 async def get_analytics_overview():
     today = date.today()
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
     
-    # Weekly stats
-    weekly_schedules = await db.daily_schedules.find({
-        "date": {"$gte": week_ago.isoformat(), "$lte": today.isoformat()}
-    }).to_list(1000)
+    adherence_counts = adherence_from_rollups if ANALYTICS_ROLLUPS else schedule_storage.adherence_counts
+    (weekly, monthly), active_courses, upcoming_appointments = await asyncio.gather(
+        adherence_counts(week_ago, month_ago, today),
+        # Active courses
+        db.pill_courses.count_documents(LIVE_COURSES),
+        # Upcoming appointments
+        db.appointments.count_documents({
+            **date_storage.match("appointment_date", "$gte", today),
+            "completed": False
+        })
+    )
+    
+    weekly_taken = weekly.get("taken", 0)
+    weekly_missed = weekly.get("missed", 0)
+    monthly_taken = monthly.get("taken", 0)
+    monthly_missed = monthly.get("missed", 0)
     
-    weekly_taken = len([s for s in weekly_schedules if s["status"] == "taken"])
-    weekly_missed = len([s for s in weekly_schedules if s["status"] == "missed"])
     weekly_total = weekly_taken + weekly_missed
     weekly_adherence = (weekly_taken / weekly_total * 100) if weekly_total > 0 else 0
     
-    # Monthly stats
-    monthly_schedules = await db.daily_schedules.find({
-        "date": {"$gte": month_ago.isoformat(), "$lte": today.isoformat()}
-    }).to_list(1000)
-    
-    monthly_taken = len([s for s in monthly_schedules if s["status"] == "taken"])
-    monthly_missed = len([s for s in monthly_schedules if s["status"] == "missed"])
     monthly_total = monthly_taken + monthly_missed
     monthly_adherence = (monthly_taken / monthly_total * 100) if monthly_total > 0 else 0
     
-    # Active courses
-    active_courses = await db.pill_courses.count_documents({})
-    
-    # Upcoming appointments
-    upcoming_appointments = await db.appointments.count_documents({
-        "appointment_date": {"$gte": today.isoformat()},
-        "completed": False
-    })
-    
     return {
         "weekly_adherence": round(weekly_adherence, 1),
         "monthly_adherence": round(monthly_adherence, 1),
@@ -368,6 +1253,206 @@ async def get_analytics_overview():
         }
     }
 
+# Longest period GET /analytics/heatmap covers in one request
+MAX_HEATMAP_RANGE_DAYS = 366
+HEATMAP_STATUSES = [PillStatus.TAKEN.value, PillStatus.MISSED.value, PillStatus.PENDING.value]
+
+@api_router.get("/analytics/heatmap")
+async def get_adherence_heatmap(from_date: str = Query(..., alias="from"), to_date: str = Query(..., alias="to")):
+    """Per-day dose counts between two dates (inclusive), in total and per slot.
+    
+    Each day is a [taken, missed, pending] array, in the order given by `statuses`,
+    and `days` holds one array per date starting at `from`.
+    """
+    first, last = parse_date_param(from_date), parse_date_param(to_date)
+    if not 0 <= (last - first).days < MAX_HEATMAP_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must span 1 to {MAX_HEATMAP_RANGE_DAYS} days")
+    counts = await schedule_storage.count_slot_statuses(first, last)
+    
+    days = [(first + timedelta(days=day)).isoformat() for day in range((last - first).days + 1)]
+    slots = {
+        time_slot.value: [[counts[(day, time_slot.value)][status] for status in HEATMAP_STATUSES] for day in days]
+        for time_slot in TimeSlot
+    }
+    return {
+        "from": first,
+        "to": last,
+        "statuses": HEATMAP_STATUSES,
+        "days": [[sum(slot_counts[index][position] for slot_counts in slots.values()) for position in range(3)]
+                 for index in range(len(days))],
+        "slots": slots
+    }
+
+@api_router.get("/analytics/streaks")
+async def get_adherence_streaks():
+    """Current and longest runs of days on which every resolved dose was taken"""
+    today = date.today()
+    doses = await schedule_storage.load_resolved_doses(until=today)
+    first = doses["date"].min().date() if len(doses) else today
+    return analytics.streaks(analytics.daily_counts(doses, first, today))
+
+@api_router.get("/analytics/rolling")
+async def get_rolling_adherence(days: int = Query(90, ge=1, le=MAX_HEATMAP_RANGE_DAYS)):
+    """Rolling 7, 30 and 90-day adherence ending on each of the last `days` days"""
+    today = date.today()
+    first = today - timedelta(days=days - 1)
+    since = first - timedelta(days=max(analytics.ROLLING_WINDOWS) - 1)
+    daily = analytics.daily_counts(await schedule_storage.load_resolved_doses(since, today), since, today)
+    return {
+        "dates": analytics.dates_between(first, today),
+        "adherence": {
+            str(window): values[-days:].tolist()
+            for window, values in analytics.rolling_adherence(daily).items()
+        }
+    }
+
+@api_router.get("/analytics/slots")
+async def get_slot_adherence():
+    """Taken, missed and adherence percentage per time slot"""
+    by_slot = analytics.adherence_by(await schedule_storage.load_resolved_doses(until=date.today()), "time_slot")
+    by_slot = by_slot.reindex([time_slot.value for time_slot in TimeSlot], fill_value=0)
+    return {
+        time_slot: {
+            "taken": int(row["taken"]),
+            "missed": int(row["missed"]),
+            "adherence_percentage": float(row["adherence_percentage"])
+        }
+        for time_slot, row in by_slot.iterrows()
+    }
+
+@api_router.get("/analytics/courses")
+async def get_course_trends(window: int = Query(30, ge=1, le=MAX_HEATMAP_RANGE_DAYS)):
+    """Per-course adherence overall and over the last two `window`-day periods, with the trend between them"""
+    today = date.today()
+    trends = analytics.course_trends(await schedule_storage.load_resolved_doses(until=today), today, window)
+    courses = await course_cache.get_many(list(trends.index))
+    return [
+        {
+            "course_id": course_id,
+            "course_name": courses[course_id].course_name,
+            "taken_pills": int(row["taken"]),
+            "missed_pills": int(row["missed"]),
+            "adherence_percentage": float(row["adherence_percentage"]),
+            "recent_adherence": float(row["recent_adherence"]),
+            "previous_adherence": float(row["previous_adherence"]),
+            "trend": float(row["trend"])
+        }
+        for course_id, row in trends.iterrows()
+        if course_id in courses
+    ]
+
+# Dashboard
+@api_router.get("/dashboard")
+async def get_dashboard():
+    """Courses, appointments, analytics overview and today's schedules in one response.
+    
+    The parts are gathered concurrently, and today's schedules are joined with the
+    course list instead of looking their courses up again.
+    """
+    today = date.today()
+    courses_loaded = asyncio.ensure_future(
+        db.pill_courses.find(LIVE_COURSES).sort([("created_at", ASCENDING), ("id", ASCENDING)]).to_list(None)
+    )
+    
+    async def today_schedules():
+        return await find_schedules(today, courses=await courses_loaded)
+    
+    course_documents, appointments, overview, schedules = await asyncio.gather(
+        courses_loaded,
+        db.appointments.find().sort([("appointment_date", ASCENDING), ("id", ASCENDING)]).to_list(None),
+        get_analytics_overview(),
+        today_schedules()
+    )
+    
+    courses = [course_codec.construct(document) for document in course_documents]
+    courses_by_id = {course.id: course for course in courses}
+    return FastJSONResponse({
+        "courses": courses,
+        "appointments": [appointment_codec.construct(appointment) for appointment in appointments],
+        "analytics": overview,
+        "today_schedules": [
+            {"schedule": DailySchedule(**schedule_codec.decode(schedule)), "course": courses_by_id[schedule["course_id"]]}
+            for schedule in schedules
+            if schedule["course_id"] in courses_by_id
+        ]
+    })
+
+# Batched requests
+# Most sub-requests one POST /batch may carry, and paths it will not run
+MAX_BATCH_REQUESTS = 50
+UNBATCHABLE_PATHS = {"/batch", "/schedules/stream"}
+
+async def call_api(request: Request, sub_request: BatchRequest) -> tuple:
+    """Run one sub-request through the app in-process; returns (status, content type, body)"""
+    path, _, query = sub_request.path.partition("?")
+    if not path.startswith("/") or path in UNBATCHABLE_PATHS:
+        return 400, "application/json", dumps_json({"detail": "Path cannot be batched"})
+    
+    payload = dumps_json(sub_request.body) if sub_request.body is not None else b""
+    # Forward the caller's headers (e.g. credentials) but describe the sub-request's own body
+    headers = [
+        (name, value) for name, value in request.headers.raw
+        if name not in (b"content-length", b"content-type")
+    ] + [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": sub_request.method,
+        "scheme": request.url.scheme,
+        "path": api_router.prefix + path,
+        "raw_path": (api_router.prefix + path).encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": headers,
+        "client": request.scope.get("client"),
+        "server": request.scope.get("server"),
+    }
+    
+    received = False
+    
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": payload, "more_body": False}
+    
+    response = {"status": 500, "headers": [], "body": []}
+    
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response.update(status=message["status"], headers=message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+    
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # The error middleware has already sent the 500 response
+        logger.exception("Batched %s %s failed", sub_request.method, sub_request.path)
+    content_type = dict(response["headers"]).get(b"content-type", b"").decode()
+    return response["status"], content_type, b"".join(response["body"])
+
+@api_router.post("/batch")
+async def run_batch(request: Request, sub_requests: List[BatchRequest]):
+    """Run GET/PUT sub-requests concurrently and return their statuses and bodies in order.
+    
+    JSON bodies are spliced into the response as-is rather than parsed and re-encoded.
+    """
+    if len(sub_requests) > MAX_BATCH_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_REQUESTS} requests per batch")
+    responses = await asyncio.gather(*(call_api(request, sub_request) for sub_request in sub_requests))
+    
+    results = []
+    for status, content_type, body in responses:
+        if not body:
+            body = b"null"
+        elif not content_type.startswith("application/json"):
+            body = dumps_json(body.decode())
+        results.append(b'{"status":%d,"body":%s}' % (status, body))
+    return Response(b"[" + b",".join(results) + b"]", media_type="application/json")
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -377,6 +1462,8 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let cross-origin clients read the keyset pagination cursor
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -386,6 +1473,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        built = await ensure_indexes()
+    except PyMongoError:
+        logger.exception("Failed to ensure MongoDB indexes")
+        return
+    for collection, names in built.items():
+        if names:
+            logger.info("Built indexes on %s: %s", collection, ", ".join(names))
+
+@app.on_event("startup")
+async def start_missed_sweeper():
+    if AUTO_MARK_MISSED_INTERVAL > 0:
+        app.state.missed_sweeper = asyncio.create_task(missed_sweep_loop())
+
+@app.on_event("startup")
+async def start_course_reaper():
+    if COURSE_REAPER_INTERVAL > 0:
+        app.state.course_reaper = asyncio.create_task(course_reaper_loop())
+
+@app.on_event("startup")
+async def start_schedule_change_stream():
+    if SCHEDULE_CHANGE_STREAM:
+        app.state.schedule_watcher = asyncio.create_task(watch_schedule_changes())
+        app.state.missed_sweep_watcher = asyncio.create_task(watch_missed_sweeps())
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for name in ("missed_sweeper", "course_reaper", "schedule_watcher", "missed_sweep_watcher"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
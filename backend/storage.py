@@ -0,0 +1,979 @@
+"""Schedule storage engines: where dose statuses live and how they are read and written.
+
+SCHEDULE_STORAGE picks one engine:
+- "materialized" writes one daily_schedules document per dose when a course is created,
+- "virtual" derives pending doses from the course and only stores taken/missed overrides,
+- "bitmap" packs every dose status of a course into one dose_bitmaps document.
+
+Every engine implements ScheduleStorage, so callers never branch on the mode.
+Engines only read and write doses; rollups and events are left to the caller.
+"""
+import asyncio
+import time as clock
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from enum import Enum
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+from bson import Int64
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import PyMongoError
+
+import analytics
+
+class TimeSlot(str, Enum):
+    MORNING = "Morning"
+    AFTERNOON = "Afternoon"
+    NIGHT = "Night"
+
+class PillStatus(str, Enum):
+    PENDING = "pending"
+    TAKEN = "taken"
+    MISSED = "missed"
+
+# Stored dates
+def decode_date(value) -> date:
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+def decode_time(value) -> time:
+    if isinstance(value, str):
+        return time.fromisoformat(value)
+    if isinstance(value, int):
+        return time(value // 3600, value // 60 % 60, value % 60)
+    return value
+
+DATE_STORAGE_MODES = ("iso", "native", "migrating")
+
+class DateStorage:
+    """Encodes dates for one DATE_STORAGE mode: "iso" (ISO strings), "native"
+    (BSON datetimes and seconds-of-day integers) or "migrating" (writes native
+    values while queries match both)
+    """
+    
+    def __init__(self, mode: str):
+        if mode not in DATE_STORAGE_MODES:
+            # Unknown modes would silently write native dates that iso queries never match
+            raise ValueError(f"Unknown DATE_STORAGE mode {mode!r}, expected one of: {', '.join(DATE_STORAGE_MODES)}")
+        self.mode = mode
+    
+    def encode_date(self, value: date):
+        if self.mode == "iso":
+            return value.isoformat()
+        return datetime(value.year, value.month, value.day)
+    
+    def encode_time(self, value: time):
+        if self.mode == "iso":
+            return value.strftime('%H:%M:%S')
+        return value.hour * 3600 + value.minute * 60 + value.second
+    
+    def timestamp(self):
+        now = datetime.now(timezone.utc)
+        return now.isoformat() if self.mode == "iso" else now
+    
+    def match(self, field: str, operator: str, value: date) -> dict:
+        """Query fragment comparing a stored date field, across both representations while migrating"""
+        if self.mode == "migrating":
+            return {"$or": [
+                {field: {operator: value.isoformat()}},
+                {field: {operator: datetime(value.year, value.month, value.day)}}
+            ]}
+        return {field: {operator: self.encode_date(value)}}
+
+# Soft-deleted courses
+# Deleting a course only sets `deleted_at`; the reaper removes its data later
+LIVE_COURSES = {"deleted_at": {"$exists": False}}
+
+class DeletedCourseIds:
+    """Per-process set of soft-deleted course ids, reloaded from MongoDB every `refresh` seconds.
+    
+    delete_course and the reaper update it directly, so a worker sees its own
+    deletes at once and those of other workers after the next reload.
+    """
+    
+    def __init__(self, db, refresh: int):
+        self.db = db
+        self.refresh = refresh
+        self.ids = set()
+        self.loaded_at = None
+    
+    async def load(self) -> List[str]:
+        """Ids of soft-deleted courses the reaper has not removed yet, read from MongoDB"""
+        return await self.db.pill_courses.distinct("id", {"deleted_at": {"$exists": True}})
+    
+    async def get(self) -> set:
+        if self.loaded_at is None or clock.monotonic() - self.loaded_at > self.refresh:
+            self.ids = set(await self.load())
+            self.loaded_at = clock.monotonic()
+        return self.ids
+    
+    def add(self, course_id: str):
+        self.ids.add(course_id)
+    
+    def discard(self, course_id: str):
+        self.ids.discard(course_id)
+
+# Dose keys
+def schedule_key(course_id: str, day_offset: int, time_slot: str) -> str:
+    """Deterministic id of a dose: course id, day offset and slot"""
+    return f"{course_id}:{day_offset}:{TimeSlot(time_slot).value}"
+
+def parse_schedule_key(schedule_id: str):
+    """Split a dose id into (course_id, day_offset, time_slot), or None"""
+    try:
+        course_id, day_offset, time_slot = schedule_id.rsplit(':', 2)
+        return course_id, int(day_offset), TimeSlot(time_slot)
+    except ValueError:
+        return None
+
+def course_day_offsets(course: dict, first: date, last: date) -> range:
+    """Day offsets of a raw course that fall between two dates (inclusive)"""
+    start_date = decode_date(course["start_date"])
+    return range(max((first - start_date).days, 0), min((last - start_date).days + 1, course["duration_days"]))
+
+def is_course_dose(course: Optional[dict], day_offset: int, time_slot: TimeSlot) -> bool:
+    return bool(course) and 0 <= day_offset < course["duration_days"] and time_slot.value in course["time_slots"]
+
+def new_course_rollups(course: dict) -> dict:
+    """Per-day counters contributed by a freshly created course: every dose pending"""
+    start_date = decode_date(course["start_date"])
+    return {
+        (start_date + timedelta(days=day)).isoformat(): Counter(pending=len(course["time_slots"]))
+        for day in range(course["duration_days"])
+    }
+
+# Dose bitmaps
+# Each dose takes 2 bits (its index in BITMAP_STATUSES) of a course's `words`,
+# ordered by day offset then slot; 31 doses per word keeps every word a positive int64
+DOSES_PER_WORD = 31
+LOW_BITS = int("01" * DOSES_PER_WORD, 2)
+BITMAP_STATUSES = [PillStatus.PENDING.value, PillStatus.TAKEN.value, PillStatus.MISSED.value]
+
+def empty_bitmap(course: dict) -> dict:
+    """Bitmap document of a freshly created course: every dose pending"""
+    doses = course["duration_days"] * len(course["time_slots"])
+    return {"course_id": course["id"], "words": [Int64(0)] * -(-doses // DOSES_PER_WORD)}
+
+def dose_index(course: dict, day_offset: int, time_slot: str) -> int:
+    return day_offset * len(course["time_slots"]) + course["time_slots"].index(TimeSlot(time_slot).value)
+
+def bitmap_status(words: List[int], index: int) -> str:
+    word, position = divmod(index, DOSES_PER_WORD)
+    return BITMAP_STATUSES[words[word] >> position * 2 & 3]
+
+def with_bitmap_status(word: int, position: int, status: str) -> int:
+    """A word with the dose at `position` set to a status"""
+    shift = position * 2
+    return word & ~(3 << shift) | BITMAP_STATUSES.index(status) << shift
+
+def pending_doses(word: int, first: int, last: int) -> int:
+    """Low bit of every pending dose at positions first <= position < last of a word"""
+    in_range = LOW_BITS & ((1 << last * 2) - 1) & ~((1 << first * 2) - 1)
+    return ~(word | word >> 1) & in_range
+
+def bitmap_day_counts(course: dict, words: List[int], first_day: int = 0, last_day: Optional[int] = None) -> dict:
+    """Per-day {date: Counter(status)} of a course's doses between two day offsets"""
+    start_date = decode_date(course["start_date"])
+    slots = len(course["time_slots"])
+    last_day = course["duration_days"] if last_day is None else min(last_day, course["duration_days"])
+    counts = {}
+    for day_offset in range(max(first_day, 0), last_day):
+        counts[(start_date + timedelta(days=day_offset)).isoformat()] = Counter(
+            bitmap_status(words, day_offset * slots + slot) for slot in range(slots)
+        )
+    return counts
+
+def count_bitmap_statuses(words: List[int]) -> dict:
+    """Taken and missed totals of a bitmap, counting set bits word by word"""
+    return {
+        PillStatus.TAKEN.value: sum((word & LOW_BITS).bit_count() for word in words),
+        PillStatus.MISSED.value: sum((word & LOW_BITS << 1).bit_count() for word in words),
+    }
+
+def bitmap_codes(words: List[int], doses: int) -> np.ndarray:
+    """The 2-bit status code of every dose of a bitmap, in dose index order"""
+    shifts = np.arange(0, 2 * DOSES_PER_WORD, 2, dtype=np.uint64)
+    return (np.array(words, dtype=np.uint64)[:, None] >> shifts & np.uint64(3)).ravel()[:doses]
+
+def settle_bulk_results(changes: List[tuple], written: int, current: dict, results: dict) -> List[tuple]:
+    """Mark the changes that landed as updated, the others as conflicts.
+    
+    If the bulk write modified as many documents as it had changes, they all landed;
+    otherwise a change landed when the dose now has the status it set (`current`).
+    """
+    landed = []
+    for schedule, previous_status in changes:
+        if written < len(changes) and current.get(schedule["id"]) != schedule["status"]:
+            results[schedule["id"]] = "conflict"
+        else:
+            results[schedule["id"]] = "updated"
+            landed.append((schedule, previous_status))
+    return landed
+
+class ScheduleStorage(ABC):
+    """Interface of the storage engines.
+    
+    A status change is reported as a (schedule document, previous status) pair.
+    The shared implementations below read daily_schedules, which holds every dose
+    in materialized mode and the overrides in virtual mode.
+    """
+    
+    def __init__(self, db, dates: DateStorage, deleted_courses: DeletedCourseIds, batch_size: int = 500,
+                 load_courses=None):
+        self.db = db
+        self.dates = dates
+        self.deleted_courses = deleted_courses
+        # Documents written per insert or upsert batch
+        self.batch_size = batch_size
+        # Async callable mapping course ids to live course documents, such as a
+        # course cache lookup; defaults to reading pill_courses
+        self.load_courses = load_courses or self.query_courses
+    
+    @abstractmethod
+    async def add_course(self, course: dict):
+        """Write the doses of a freshly created raw course"""
+    
+    @abstractmethod
+    async def find_schedules(self, first: date, last: date, status: Optional[str] = None,
+                             course_id: Optional[str] = None, courses: Optional[List[dict]] = None) -> List[dict]:
+        """Raw schedule documents due between two dates (inclusive).
+        
+        Derived engines reuse `courses`, the raw live courses, when the caller already loaded them.
+        """
+    
+    async def set_status(self, schedule_id: str, status: PillStatus) -> Optional[tuple]:
+        """Set the status of a dose; returns the change, or None if there is no such dose"""
+        dose = await self.find_dose(schedule_id)
+        if dose is None:
+            return None
+        return await self.set_dose_status(*dose, status)
+    
+    @abstractmethod
+    async def set_dose_status(self, course: dict, day_offset: int, time_slot: TimeSlot,
+                              status: PillStatus) -> Optional[tuple]:
+        """Set the status of a dose given by its course, day and slot.
+        
+        `course` is the course document the caller already holds, so it is not loaded again.
+        """
+    
+    @abstractmethod
+    async def set_statuses(self, updates: Dict[str, PillStatus], results: dict) -> List[tuple]:
+        """Apply many status updates, each guarded by the state read just before it.
+        
+        Fills `results` with "updated", "unchanged" or "conflict" per id (ids left
+        alone are unknown) and returns the changes that landed.
+        """
+    
+    @abstractmethod
+    def mark_missed(self, before: date) -> AsyncIterator[Counter]:
+        """Mark pending doses before a date as missed, yielding {date: count} after each write.
+        
+        Stored documents written by the sweep carry `swept_at`, so event streams can
+        leave them to the single summary event of the sweep.
+        """
+    
+    async def live_schedules(self) -> dict:
+        """Query fragment hiding the stored schedules of soft-deleted courses"""
+        deleted = await self.deleted_courses.get()
+        return {"course_id": {"$nin": list(deleted)}} if deleted else {}
+    
+    async def remove_course(self, course_id: str, batch_size: int, pause: float = 0) -> int:
+        """Delete a course's stored doses in batches, sleeping `pause` seconds between them"""
+        removed = 0
+        while True:
+            batch = await self.db.daily_schedules.find(
+                {"course_id": course_id}, projection={"_id": True}
+            ).limit(batch_size).to_list(None)
+            if not batch:
+                break
+            result = await self.db.daily_schedules.delete_many({"_id": {"$in": [schedule["_id"] for schedule in batch]}})
+            removed += result.deleted_count
+            await asyncio.sleep(pause)
+        await self.db.dose_bitmaps.delete_one({"course_id": course_id})
+        return removed
+    
+    async def count_stored(self, course_ids: List[str]) -> int:
+        """Number of documents this engine stores for the given courses, such as the reaper's backlog"""
+        return await self.db.daily_schedules.count_documents({"course_id": {"$in": course_ids}})
+    
+    async def count_doses(self, course_ids: List[str]) -> dict:
+        """{course id: {status: count}} of live courses; deleted and unknown courses count nothing"""
+        counts = {course_id: {status.value: 0 for status in PillStatus} for course_id in course_ids}
+        deleted = await self.deleted_courses.get()
+        async for row in self.db.daily_schedules.aggregate([
+            {"$match": {"course_id": {"$in": [course_id for course_id in course_ids if course_id not in deleted]}}},
+            {"$group": {"_id": {"course_id": "$course_id", "status": "$status"}, "count": {"$sum": 1}}}
+        ]):
+            counts[row["_id"]["course_id"]][row["_id"]["status"]] = row["count"]
+        return counts
+    
+    async def course_rollups(self, course: dict) -> dict:
+        """Current per-day status counters of a stored course"""
+        counts = defaultdict(Counter)
+        async for row in self.db.daily_schedules.aggregate([
+            {"$match": {"course_id": course["id"]}},
+            {"$group": {"_id": {"date": "$date", "status": "$status"}, "count": {"$sum": 1}}}
+        ]):
+            counts[decode_date(row["_id"]["date"]).isoformat()][row["_id"]["status"]] += row["count"]
+        return counts
+    
+    async def count_slot_statuses(self, first: date, last: date) -> dict:
+        """{(ISO date, slot): Counter(status)} of the doses due between two dates (inclusive)"""
+        counts = defaultdict(Counter)
+        async for row in self.db.daily_schedules.aggregate([
+            {"$match": {
+                "$and": [self.dates.match("date", "$gte", first), self.dates.match("date", "$lte", last)],
+                **await self.live_schedules()
+            }},
+            {"$group": {
+                "_id": {"date": "$date", "time_slot": "$time_slot", "status": "$status"},
+                "count": {"$sum": 1}
+            }}
+        ]):
+            key = (decode_date(row["_id"]["date"]).isoformat(), TimeSlot(row["_id"]["time_slot"]).value)
+            counts[key][row["_id"]["status"]] += row["count"]
+        return counts
+    
+    async def adherence_counts(self, week_ago: date, month_ago: date, today: date):
+        """Weekly and monthly {status: count} from one $facet aggregation over daily_schedules"""
+        group_by_status = {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        facets = await self.db.daily_schedules.aggregate([
+            {"$match": {
+                "$and": [self.dates.match("date", "$gte", month_ago), self.dates.match("date", "$lte", today)],
+                "status": {"$in": ["taken", "missed"]},
+                **await self.live_schedules()
+            }},
+            {"$facet": {
+                "weekly": [{"$match": self.dates.match("date", "$gte", week_ago)}, group_by_status],
+                "monthly": [group_by_status]
+            }}
+        ]).to_list(1)
+        return tuple(
+            {row["_id"]: row["count"] for row in facets[0][window]}
+            for window in ("weekly", "monthly")
+        )
+    
+    async def load_resolved_doses(self, since: Optional[date] = None, until: Optional[date] = None):
+        """Taken and missed doses of live courses between two dates, as an analytics frame"""
+        query = {"status": {"$in": [PillStatus.TAKEN.value, PillStatus.MISSED.value]}, **await self.live_schedules()}
+        ranges = (
+            ([self.dates.match("date", "$gte", since)] if since else [])
+            + ([self.dates.match("date", "$lte", until)] if until else [])
+        )
+        if ranges:
+            query["$and"] = ranges
+        # One row per date, slot and course with its counts, rather than one per dose
+        groups = await self.db.daily_schedules.aggregate([
+            {"$match": query},
+            {"$group": {
+                "_id": {"date": "$date", "time_slot": "$time_slot", "course_id": "$course_id"},
+                **{
+                    status.value: {"$sum": {"$cond": [{"$eq": ["$status", status.value]}, 1, 0]}}
+                    for status in (PillStatus.TAKEN, PillStatus.MISSED)
+                },
+            }},
+        ]).to_list(None)
+        return analytics.doses_frame(
+            [decode_date(group["_id"]["date"]) for group in groups],
+            [TimeSlot(group["_id"]["time_slot"]).value for group in groups],
+            [group["_id"]["course_id"] for group in groups],
+            [group[PillStatus.TAKEN.value] for group in groups],
+            [group[PillStatus.MISSED.value] for group in groups],
+        )
+    
+    # Helpers of the engines that derive doses from their course
+    def virtual_schedule(self, course: dict, day_offset: int, time_slot: str) -> dict:
+        """Build the pending schedule document of a dose from its raw course document"""
+        current_date = decode_date(course["start_date"]) + timedelta(days=day_offset)
+        return {
+            "id": schedule_key(course["id"], day_offset, time_slot),
+            "course_id": course["id"],
+            "date": self.dates.encode_date(current_date),
+            "time_slot": TimeSlot(time_slot).value,
+            "status": PillStatus.PENDING.value,
+            "updated_at": course["created_at"],
+        }
+    
+    async def query_courses(self, course_ids: List[str]) -> dict:
+        """Live courses by id, read from pill_courses"""
+        return {
+            course["id"]: course
+            async for course in self.db.pill_courses.find({"id": {"$in": course_ids}, **LIVE_COURSES})
+        }
+    
+    async def find_active_courses(self, first: date, last: date, course_id: Optional[str] = None,
+                                  courses: Optional[List[dict]] = None) -> List[dict]:
+        """Live courses with doses between two dates (inclusive), picked from `courses` if already loaded"""
+        if courses is None:
+            if course_id:
+                course_ids = [course_id]
+            else:
+                # Only the ids are read here; the documents come from load_courses
+                course_ids = await self.db.pill_courses.distinct(
+                    "id", {**self.dates.match("start_date", "$lte", last), **LIVE_COURSES}
+                )
+            courses = list((await self.load_courses(course_ids)).values())
+        return [
+            course for course in courses
+            if course_day_offsets(course, first, last) and course_id in (None, course["id"])
+        ]
+    
+    async def find_dose(self, schedule_id: str):
+        """Resolve a dose id to (raw course, day offset, time slot), or None"""
+        key = parse_schedule_key(schedule_id)
+        if key is None:
+            return None
+        course_id, day_offset, time_slot = key
+        course = (await self.load_courses([course_id])).get(course_id)
+        if not is_course_dose(course, day_offset, time_slot):
+            return None
+        return course, day_offset, time_slot
+    
+    async def find_doses(self, schedule_ids: List[str]) -> dict:
+        """Resolve many dose ids with one course lookup; unknown ids are left out"""
+        keys = {schedule_id: parse_schedule_key(schedule_id) for schedule_id in schedule_ids}
+        courses = await self.load_courses(list({key[0] for key in keys.values() if key}))
+        doses = {}
+        for schedule_id, key in keys.items():
+            if key and is_course_dose(courses.get(key[0]), key[1], key[2]):
+                doses[schedule_id] = (courses[key[0]], key[1], key[2])
+        return doses
+    
+    async def course_sizes(self, course_ids: List[str]) -> dict:
+        """Number of doses of each live course"""
+        return {
+            course_id: course["duration_days"] * len(course["time_slots"])
+            for course_id, course in (await self.load_courses(course_ids)).items()
+        }
+    
+    async def find_courses_to_sweep(self, before: date) -> List[dict]:
+        """Courses started before a date whose doses have not been swept up to it or to their end"""
+        return await self.db.pill_courses.find({"$and": [
+            LIVE_COURSES,
+            self.dates.match("start_date", "$lt", before),
+            {"$or": [
+                {"missed_through": {"$exists": False}},
+                {"$and": [
+                    self.dates.match("missed_through", "$lt", before),
+                    # `end_date` is recorded with the first sweep; a course swept past it is done
+                    {"$or": [{"end_date": {"$exists": False}}, {"$expr": {"$lt": ["$missed_through", "$end_date"]}}]}
+                ]}
+            ]}
+        ]}).to_list(None)
+    
+    def sweep_range(self, course: dict, before: date) -> range:
+        """Day offsets of a course's doses that are due before a date and not swept yet"""
+        start_date = decode_date(course["start_date"])
+        first_day = (decode_date(course["missed_through"]) - start_date).days if course.get("missed_through") else 0
+        return range(first_day, min(course["duration_days"], (before - start_date).days))
+    
+    async def set_swept_through(self, course: dict, before: date):
+        """Record that a course's doses before a date have been swept, so later sweeps skip them"""
+        end_date = decode_date(course["start_date"]) + timedelta(days=course["duration_days"])
+        await self.db.pill_courses.update_one({"id": course["id"]}, {"$set": {
+            "missed_through": self.dates.encode_date(before),
+            "end_date": self.dates.encode_date(end_date)
+        }})
+
+class MaterializedStorage(ScheduleStorage):
+    """One daily_schedules document per dose, written when the course is created"""
+    
+    async def add_course(self, course: dict):
+        schedules = [
+            self.virtual_schedule(course, day_offset, time_slot)
+            for day_offset in range(course["duration_days"])
+            for time_slot in course["time_slots"]
+        ]
+        # Remove what was written if the schedules cannot be written in full
+        try:
+            for start in range(0, len(schedules), self.batch_size):
+                await self.db.daily_schedules.insert_many(schedules[start:start + self.batch_size], ordered=False)
+        except PyMongoError:
+            await self.db.daily_schedules.delete_many({"course_id": course["id"]})
+            raise
+    
+    async def find_schedules(self, first, last, status=None, course_id=None, courses=None):
+        query = {
+            "$and": [self.dates.match("date", "$gte", first), self.dates.match("date", "$lte", last)],
+            **await self.live_schedules()
+        }
+        if status:
+            query["status"] = status
+        if course_id:
+            query["$and"].append({"course_id": course_id})
+        return await self.db.daily_schedules.find(query).to_list(None)
+    
+    async def set_status(self, schedule_id, status):
+        return await self.set_stored_status({"id": schedule_id}, status)
+    
+    async def set_dose_status(self, course, day_offset, time_slot, status):
+        change = await self.set_status(schedule_key(course["id"], day_offset, time_slot), status)
+        if change is None:
+            # Courses created before dose ids were derived from the key keep random schedule ids
+            on_date = decode_date(course["start_date"]) + timedelta(days=day_offset)
+            change = await self.set_stored_status(
+                {"course_id": course["id"], **self.dates.match("date", "$eq", on_date), "time_slot": time_slot.value},
+                status
+            )
+        return change
+    
+    async def set_stored_status(self, query: dict, status: PillStatus) -> Optional[tuple]:
+        previous = await self.db.daily_schedules.find_one_and_update(
+            {"$and": [query, await self.live_schedules()]},
+            {"$set": {"status": status, "updated_at": self.dates.timestamp()}},
+            projection={"id": True, "course_id": True, "date": True, "time_slot": True, "status": True}
+        )
+        if previous is None:
+            return None
+        return {**previous, "status": status.value}, previous["status"]
+    
+    async def set_statuses(self, updates, results):
+        previous = {
+            schedule["id"]: schedule async for schedule in self.db.daily_schedules.find(
+                {"id": {"$in": list(updates)}, **await self.live_schedules()},
+                projection={"_id": False, "id": True, "course_id": True, "date": True, "time_slot": True, "status": True}
+            )
+        }
+        now = self.dates.timestamp()
+        operations, changes = [], []
+        for schedule_id, status in updates.items():
+            schedule = previous.get(schedule_id)
+            if schedule is None:
+                continue
+            if schedule["status"] == status.value:
+                results[schedule_id] = "unchanged"
+                continue
+            operations.append(UpdateOne(
+                {"id": schedule_id, "status": schedule["status"]},
+                {"$set": {"status": status.value, "updated_at": now}}
+            ))
+            changes.append(({**schedule, "status": status.value}, schedule["status"]))
+        if not operations:
+            return []
+        
+        result = await self.db.daily_schedules.bulk_write(operations, ordered=False)
+        current = {}
+        if result.modified_count < len(changes):
+            current = {
+                schedule["id"]: schedule["status"]
+                async for schedule in self.db.daily_schedules.find({"id": {"$in": list(updates)}})
+            }
+        return settle_bulk_results(changes, result.modified_count, current, results)
+    
+    async def mark_missed(self, before):
+        # One date at a time, so each update stays small
+        live = await self.live_schedules()
+        pending_dates = await self.db.daily_schedules.distinct("date", {
+            **self.dates.match("date", "$lt", before),
+            "status": "pending",
+            **live
+        })
+        for pending_date in sorted(pending_dates):
+            now = self.dates.timestamp()
+            result = await self.db.daily_schedules.update_many(
+                {"date": pending_date, "status": "pending", **live},
+                {"$set": {"status": "missed", "updated_at": now, "swept_at": now}}
+            )
+            if result.modified_count:
+                yield Counter({decode_date(pending_date).isoformat(): result.modified_count})
+
+class VirtualStorage(ScheduleStorage):
+    """Pending doses derived from their course; only taken/missed overrides are stored"""
+    
+    async def add_course(self, course):
+        pass
+    
+    async def find_schedules(self, first, last, status=None, course_id=None, courses=None):
+        courses = await self.find_active_courses(first, last, course_id, courses)
+        schedules = {}
+        for course in courses:
+            for day_offset in course_day_offsets(course, first, last):
+                for time_slot in course["time_slots"]:
+                    schedule = self.virtual_schedule(course, day_offset, time_slot)
+                    schedules[schedule["id"]] = schedule
+        
+        overrides = await self.db.daily_schedules.find({
+            "$and": [self.dates.match("date", "$gte", first), self.dates.match("date", "$lte", last)],
+            "course_id": {"$in": [course["id"] for course in courses]}
+        }).to_list(None)
+        for override in overrides:
+            if override["id"] in schedules:
+                schedules[override["id"]] = override
+        
+        return [s for s in schedules.values() if status is None or s["status"] == status]
+    
+    async def set_dose_status(self, course, day_offset, time_slot, status):
+        """Persist (or clear) the status override of a dose"""
+        if not is_course_dose(course, day_offset, TimeSlot(time_slot)):
+            return None
+        
+        schedule = self.virtual_schedule(course, day_offset, time_slot)
+        if status == PillStatus.PENDING:
+            previous = await self.db.daily_schedules.find_one_and_delete(
+                {"id": schedule["id"]}, projection={"status": True}
+            )
+        else:
+            schedule.update(status=status.value, updated_at=self.dates.timestamp())
+            previous = await self.db.daily_schedules.find_one_and_replace(
+                {"id": schedule["id"]}, schedule, projection={"status": True}, upsert=True
+            )
+        
+        previous_status = previous["status"] if previous else PillStatus.PENDING.value
+        return {**schedule, "status": status.value}, previous_status
+    
+    async def set_statuses(self, updates, results):
+        doses = await self.find_doses(list(updates))
+        overrides = {
+            override["id"]: override["status"]
+            async for override in self.db.daily_schedules.find({"id": {"$in": list(doses)}})
+        }
+        now = self.dates.timestamp()
+        operations, changes = [], []
+        for schedule_id, dose in doses.items():
+            status = updates[schedule_id].value
+            previous_status = overrides.get(schedule_id, PillStatus.PENDING.value)
+            if previous_status == status:
+                results[schedule_id] = "unchanged"
+                continue
+            schedule = self.virtual_schedule(*dose)
+            schedule.update(status=status, updated_at=now)
+            if schedule_id not in overrides:
+                operations.append(UpdateOne({"id": schedule_id}, {"$setOnInsert": schedule}, upsert=True))
+            elif status == PillStatus.PENDING.value:
+                operations.append(DeleteOne({"id": schedule_id, "status": previous_status}))
+            else:
+                operations.append(UpdateOne(
+                    {"id": schedule_id, "status": previous_status},
+                    {"$set": {"status": status, "updated_at": now}}
+                ))
+            changes.append((schedule, previous_status))
+        if not operations:
+            return []
+        
+        result = await self.db.daily_schedules.bulk_write(operations, ordered=False)
+        written = result.upserted_count + result.modified_count + result.deleted_count
+        current = {}
+        if written < len(changes):
+            current = {schedule_id: PillStatus.PENDING.value for schedule_id in doses}
+            async for override in self.db.daily_schedules.find({"id": {"$in": list(doses)}}):
+                current[override["id"]] = override["status"]
+        return settle_bulk_results(changes, written, current, results)
+    
+    async def mark_missed(self, before):
+        """Persist missed overrides for doses that have none, course by course.
+        
+        Each course records the date it has been swept up to (`missed_through`),
+        so later sweeps only look at the days since.
+        """
+        now = self.dates.timestamp()
+        for course in await self.find_courses_to_sweep(before):
+            days = self.sweep_range(course, before)
+            start_date = decode_date(course["start_date"])
+            overridden = set(await self.db.daily_schedules.distinct("id", {"$and": [
+                {"course_id": course["id"]},
+                self.dates.match("date", "$gte", start_date + timedelta(days=days.start)),
+                self.dates.match("date", "$lt", before)
+            ]}))
+            missed = []
+            for day_offset in days:
+                for time_slot in course["time_slots"]:
+                    schedule = self.virtual_schedule(course, day_offset, time_slot)
+                    if schedule["id"] not in overridden:
+                        schedule.update(status=PillStatus.MISSED.value, updated_at=now, swept_at=now)
+                        missed.append(schedule)
+            yield await self.insert_missed_overrides(missed)
+            await self.set_swept_through(course, before)
+    
+    async def insert_missed_overrides(self, missed: List[dict]) -> Counter:
+        """Upsert missed overrides in batches, leaving any override written since the sweep read them.
+        
+        Returns {date: inserted count}, counting only the overrides this call inserted.
+        """
+        inserted = Counter()
+        for start in range(0, len(missed), self.batch_size):
+            batch = missed[start:start + self.batch_size]
+            result = await self.db.daily_schedules.bulk_write(
+                [UpdateOne({"id": schedule["id"]}, {"$setOnInsert": schedule}, upsert=True) for schedule in batch],
+                ordered=False
+            )
+            for index in result.upserted_ids:
+                inserted[decode_date(batch[index]["date"]).isoformat()] += 1
+        return inserted
+    
+    async def count_doses(self, course_ids):
+        # Pending doses are never stored, so derive them from the course size
+        counts = await super().count_doses(course_ids)
+        sizes = await self.course_sizes(course_ids)
+        for course_id, statuses in counts.items():
+            statuses["pending"] = sizes.get(course_id, 0) - statuses["taken"] - statuses["missed"]
+        return counts
+    
+    async def course_rollups(self, course):
+        counts = await super().course_rollups(course)
+        # Overrides replace doses that would otherwise be pending
+        for day, pending in new_course_rollups(course).items():
+            counts[day]["pending"] += pending["pending"] - counts[day]["taken"] - counts[day]["missed"]
+        return counts
+    
+    async def count_slot_statuses(self, first, last):
+        counts = await super().count_slot_statuses(first, last)
+        for course in await self.find_active_courses(first, last):
+            start_date = decode_date(course["start_date"])
+            for day_offset in course_day_offsets(course, first, last):
+                day = (start_date + timedelta(days=day_offset)).isoformat()
+                for time_slot in course["time_slots"]:
+                    statuses = counts[(day, TimeSlot(time_slot).value)]
+                    statuses[PillStatus.PENDING.value] += 1
+        # Overrides replace doses that would otherwise be pending
+        for statuses in counts.values():
+            statuses[PillStatus.PENDING.value] -= statuses[PillStatus.TAKEN.value] + statuses[PillStatus.MISSED.value]
+        return counts
+
+class BitmapStorage(ScheduleStorage):
+    """Every dose status of a course packed into the `words` of one dose_bitmaps document"""
+    
+    async def add_course(self, course):
+        await self.db.dose_bitmaps.insert_one(empty_bitmap(course))
+    
+    async def load_bitmaps(self, course_ids: List[str]) -> dict:
+        """Map course ids to their bitmap words"""
+        return {
+            bitmap["course_id"]: bitmap["words"]
+            async for bitmap in self.db.dose_bitmaps.find({"course_id": {"$in": course_ids}})
+        }
+    
+    async def count_stored(self, course_ids):
+        return await self.db.dose_bitmaps.count_documents({"course_id": {"$in": course_ids}})
+    
+    async def find_schedules(self, first, last, status=None, course_id=None, courses=None):
+        courses = await self.find_active_courses(first, last, course_id, courses)
+        bitmaps = await self.load_bitmaps([course["id"] for course in courses])
+        
+        schedules = []
+        for course in courses:
+            words = bitmaps.get(course["id"])
+            if words is None:
+                continue
+            for day_offset in course_day_offsets(course, first, last):
+                for time_slot in course["time_slots"]:
+                    schedule = self.virtual_schedule(course, day_offset, time_slot)
+                    schedule["status"] = bitmap_status(words, dose_index(course, day_offset, time_slot))
+                    if status is None or schedule["status"] == status:
+                        schedules.append(schedule)
+        return schedules
+    
+    async def set_dose_status(self, course, day_offset, time_slot, status):
+        """Rewrite the 2 status bits of a dose in place with $bit"""
+        if not is_course_dose(course, day_offset, TimeSlot(time_slot)):
+            return None
+        
+        word, position = divmod(dose_index(course, day_offset, time_slot), DOSES_PER_WORD)
+        shift = position * 2
+        previous = await self.db.dose_bitmaps.find_one_and_update(
+            {"course_id": course["id"]},
+            {"$bit": {f"words.{word}": {
+                "and": Int64(~(3 << shift)),
+                "or": Int64(BITMAP_STATUSES.index(status.value) << shift)
+            }}},
+            projection={"words": {"$slice": [word, 1]}}
+        )
+        if previous is None:
+            return None
+        
+        schedule = self.virtual_schedule(course, day_offset, time_slot)
+        schedule.update(status=status.value, updated_at=self.dates.timestamp())
+        return schedule, BITMAP_STATUSES[previous["words"][0] >> shift & 3]
+    
+    async def set_statuses(self, updates, results):
+        doses = await self.find_doses(list(updates))
+        bitmaps = await self.load_bitmaps(list({course["id"] for course, _, _ in doses.values()}))
+        now = self.dates.timestamp()
+        # course id: {word index: (stored value, new value)}
+        words = defaultdict(dict)
+        changes = []
+        for schedule_id, (course, day_offset, time_slot) in doses.items():
+            if course["id"] not in bitmaps:
+                continue
+            word, position = divmod(dose_index(course, day_offset, time_slot), DOSES_PER_WORD)
+            stored, value = words[course["id"]].get(word, (bitmaps[course["id"]][word],) * 2)
+            previous_status = BITMAP_STATUSES[value >> position * 2 & 3]
+            status = updates[schedule_id].value
+            if previous_status == status:
+                results[schedule_id] = "unchanged"
+                continue
+            words[course["id"]][word] = (stored, with_bitmap_status(value, position, status))
+            schedule = self.virtual_schedule(course, day_offset, time_slot)
+            schedule.update(status=status, updated_at=now)
+            changes.append((schedule, previous_status))
+        if not changes:
+            return []
+        
+        # One write per course, guarded by every word it rewrites
+        operations = [
+            UpdateOne(
+                {"course_id": course_id, **{f"words.{word}": stored for word, (stored, _) in changed.items()}},
+                {"$set": {f"words.{word}": Int64(value) for word, (_, value) in changed.items()}}
+            )
+            for course_id, changed in words.items()
+        ]
+        result = await self.db.dose_bitmaps.bulk_write(operations, ordered=False)
+        written = len(changes) if result.modified_count == len(operations) else 0
+        current = {}
+        if not written:
+            # The write of a course fails as a whole, so settle each dose from fresh bitmaps
+            bitmaps = await self.load_bitmaps(list(words))
+            current = {
+                schedule_id: bitmap_status(bitmaps[course["id"]], dose_index(course, day_offset, time_slot))
+                for schedule_id, (course, day_offset, time_slot) in doses.items()
+                if course["id"] in bitmaps
+            }
+        return settle_bulk_results(changes, written, current, results)
+    
+    async def mark_missed(self, before):
+        """Flip pending doses to missed, one bitmap word at a time.
+        
+        Each word is replaced only if it still holds the value it was computed from,
+        so status updates landing meanwhile are retried rather than overwritten.
+        """
+        courses = await self.find_courses_to_sweep(before)
+        bitmaps = await self.load_bitmaps([course["id"] for course in courses])
+        for course in courses:
+            words = bitmaps.get(course["id"])
+            if words is None:
+                continue
+            days = self.sweep_range(course, before)
+            yield await self.mark_words_missed(course, words, days.start * len(course["time_slots"]),
+                                               days.stop * len(course["time_slots"]))
+            await self.set_swept_through(course, before)
+    
+    async def mark_words_missed(self, course: dict, words: List[int], first_index: int, last_index: int) -> Counter:
+        """Mark the pending doses first_index <= index < last_index of a course missed; returns {date: count}"""
+        start_date = decode_date(course["start_date"])
+        slots = len(course["time_slots"])
+        marked = Counter()
+        for word in range(first_index // DOSES_PER_WORD, -(-last_index // DOSES_PER_WORD)):
+            offset = word * DOSES_PER_WORD
+            first, last = max(first_index - offset, 0), min(last_index - offset, DOSES_PER_WORD)
+            while True:
+                value = words[word]
+                pending = pending_doses(value, first, last)
+                if not pending:
+                    break
+                result = await self.db.dose_bitmaps.update_one(
+                    {"course_id": course["id"], f"words.{word}": value},
+                    {"$set": {f"words.{word}": Int64(value | pending << 1)}}
+                )
+                if result.modified_count:
+                    for position in range(DOSES_PER_WORD):
+                        if pending >> position * 2 & 1:
+                            day_offset = (offset + position) // slots
+                            marked[(start_date + timedelta(days=day_offset)).isoformat()] += 1
+                    break
+                current = await self.db.dose_bitmaps.find_one(
+                    {"course_id": course["id"]}, projection={"words": {"$slice": [word, 1]}}
+                )
+                if current is None:
+                    break
+                words[word] = current["words"][0]
+        return marked
+    
+    async def count_doses(self, course_ids):
+        counts = {course_id: {status.value: 0 for status in PillStatus} for course_id in course_ids}
+        deleted = await self.deleted_courses.get()
+        live_ids = [course_id for course_id in course_ids if course_id not in deleted]
+        sizes = await self.course_sizes(live_ids)
+        for course_id, words in (await self.load_bitmaps(live_ids)).items():
+            counts[course_id].update(count_bitmap_statuses(words))
+        for course_id, statuses in counts.items():
+            statuses["pending"] = sizes.get(course_id, 0) - statuses["taken"] - statuses["missed"]
+        return counts
+    
+    async def course_rollups(self, course):
+        counts = defaultdict(Counter)
+        bitmap = await self.db.dose_bitmaps.find_one({"course_id": course["id"]})
+        if bitmap:
+            counts.update(bitmap_day_counts(course, bitmap["words"]))
+        return counts
+    
+    async def count_slot_statuses(self, first, last):
+        counts = defaultdict(Counter)
+        courses = await self.find_active_courses(first, last)
+        bitmaps = await self.load_bitmaps([course["id"] for course in courses])
+        for course in courses:
+            if course["id"] not in bitmaps:
+                continue
+            start_date = decode_date(course["start_date"])
+            for day_offset in course_day_offsets(course, first, last):
+                day = (start_date + timedelta(days=day_offset)).isoformat()
+                for time_slot in course["time_slots"]:
+                    status = bitmap_status(bitmaps[course["id"]], dose_index(course, day_offset, time_slot))
+                    counts[(day, TimeSlot(time_slot).value)][status] += 1
+        return counts
+    
+    async def adherence_counts(self, week_ago, month_ago, today):
+        """Weekly and monthly {status: count} decoded from the bitmaps of courses in the window"""
+        courses = await self.db.pill_courses.find(
+            {**self.dates.match("start_date", "$lte", today), **LIVE_COURSES}
+        ).to_list(None)
+        bitmaps = await self.load_bitmaps([course["id"] for course in courses])
+        weekly, monthly = Counter(), Counter()
+        for course in courses:
+            if course["id"] not in bitmaps:
+                continue
+            start_date = decode_date(course["start_date"])
+            days = bitmap_day_counts(
+                course, bitmaps[course["id"]], (month_ago - start_date).days, (today - start_date).days + 1
+            )
+            for day, counts in days.items():
+                counts = {status: counts[status] for status in ("taken", "missed")}
+                monthly.update(counts)
+                if day >= week_ago.isoformat():
+                    weekly.update(counts)
+        return weekly, monthly
+    
+    async def load_resolved_doses(self, since=None, until=None):
+        query = dict(LIVE_COURSES)
+        if until:
+            query.update(self.dates.match("start_date", "$lte", until))
+        courses = await self.db.pill_courses.find(query).to_list(None)
+        bitmaps = await self.load_bitmaps([course["id"] for course in courses])
+        columns = []
+        for course in courses:
+            if course["id"] not in bitmaps:
+                continue
+            slots = np.array([TimeSlot(time_slot).value for time_slot in course["time_slots"]])
+            codes = bitmap_codes(bitmaps[course["id"]], course["duration_days"] * len(slots))
+            resolved = np.flatnonzero(codes)
+            dates = np.datetime64(decode_date(course["start_date"]), "D") + resolved // len(slots)
+            keep = np.ones(len(resolved), dtype=bool)
+            if since:
+                keep &= dates >= np.datetime64(since, "D")
+            if until:
+                keep &= dates <= np.datetime64(until, "D")
+            kept = codes[resolved][keep]
+            columns.append((
+                dates[keep],
+                slots[resolved % len(slots)][keep],
+                np.full(keep.sum(), course["id"], dtype=object),
+                kept == BITMAP_STATUSES.index(PillStatus.TAKEN.value),
+                kept == BITMAP_STATUSES.index(PillStatus.MISSED.value)
+            ))
+        if not columns:
+            return analytics.doses_frame([], [], [], [], [])
+        return analytics.doses_frame(*(np.concatenate(column) for column in zip(*columns)))
+
+SCHEDULE_STORAGES = {
+    "materialized": MaterializedStorage,
+    "virtual": VirtualStorage,
+    "bitmap": BitmapStorage,
+}
+
+def create_schedule_storage(mode: str, db, dates: DateStorage, deleted_courses: DeletedCourseIds,
+                            batch_size: int = 500, load_courses=None) -> ScheduleStorage:
+    """The engine for a SCHEDULE_STORAGE mode; unknown modes fall back to materialized"""
+    return SCHEDULE_STORAGES.get(mode, MaterializedStorage)(db, dates, deleted_courses, batch_size, load_courses)
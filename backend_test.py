@@ -98,6 +98,18 @@ class CareLogAPITester:
             error_msg = f"Status: {response.status_code if response else 'No response'}"
             self.log_result("Get All Courses", False, error_msg)
 
+        # Test 2b: Keyset pagination of courses
+        response = self.make_request("GET", "/courses", params={"limit": 1})
+        if response and response.status_code == 200:
+            page = response.json()
+            if isinstance(page, list) and len(page) <= 1:
+                self.log_result("Paginate Courses", True)
+            else:
+                self.log_result("Paginate Courses", False, f"Expected at most 1 course, got {len(page)}")
+        else:
+            error_msg = f"Status: {response.status_code if response else 'No response'}"
+            self.log_result("Paginate Courses", False, error_msg)
+
         # Test 3: Get specific course
         if self.created_course_id:
             response = self.make_request("GET", f"/courses/{self.created_course_id}")
@@ -166,6 +178,19 @@ class CareLogAPITester:
             error_msg = f"Status: {response.status_code if response else 'No response'}"
             self.log_result("Get Schedules by Date", False, error_msg)
 
+        # Test 2b: Get schedules for a date range, grouped by date
+        week_end_str = (date.today() + timedelta(days=6)).isoformat()
+        response = self.make_request("GET", "/schedules", params={"from": today_str, "to": week_end_str})
+        if response and response.status_code == 200:
+            grouped = response.json()
+            if isinstance(grouped, dict) and len(grouped) == 7 and today_str in grouped:
+                self.log_result("Get Schedules by Range", True)
+            else:
+                self.log_result("Get Schedules by Range", False, "Invalid response format")
+        else:
+            error_msg = f"Status: {response.status_code if response else 'No response'}"
+            self.log_result("Get Schedules by Range", False, error_msg)
+
         # Test 3: Update schedule status
         if self.created_schedule_id:
             update_data = {"status": "taken"}
@@ -178,6 +203,20 @@ class CareLogAPITester:
                     error_msg += f", Response: {response.text}"
                 self.log_result("Update Schedule Status", False, error_msg)
 
+        # Test 4: Update dose status by course, date and slot
+        if self.created_course_id:
+            response = self.make_request("GET", f"/courses/{self.created_course_id}")
+            if response and response.status_code == 200 and response.json()["start_date"] <= today_str:
+                slot = response.json()["time_slots"][0]
+                response = self.make_request(
+                    "PUT", f"/courses/{self.created_course_id}/doses/{today_str}/{slot}", {"status": "taken"}
+                )
+                if response and response.status_code == 200:
+                    self.log_result("Update Dose Status by Key", True)
+                else:
+                    error_msg = f"Status: {response.status_code if response else 'No response'}"
+                    self.log_result("Update Dose Status by Key", False, error_msg)
+
     def test_course_progress_analytics(self):
         """Test Course Progress Analytics API"""
         print("\n🧪 Testing Course Progress Analytics API...")
@@ -227,6 +266,18 @@ class CareLogAPITester:
                 error_msg += f", Response: {response.text}"
             self.log_result("Course Progress Analytics", False, error_msg)
 
+        # Batch progress for many courses in one call
+        response = self.make_request("GET", "/courses/progress", params={"ids": self.created_course_id})
+        if response and response.status_code == 200:
+            batch = response.json()
+            if isinstance(batch, list) and len(batch) == 1 and batch[0].get("course_id") == self.created_course_id:
+                self.log_result("Batch Course Progress", True)
+            else:
+                self.log_result("Batch Course Progress", False, f"Unexpected response: {batch}")
+        else:
+            error_msg = f"Status: {response.status_code if response else 'No response'}"
+            self.log_result("Batch Course Progress", False, error_msg)
+
     def test_appointment_management(self):
         """Test Appointment Management API"""
         print("\n🧪 Testing Appointment Management API...")
@@ -374,6 +425,21 @@ class CareLogAPITester:
             self.log_result("Non-existent Appointment Error Handling", False, 
                           f"Expected 404, got {response.status_code if response else 'No response'}")
 
+        # Test 4: Create a course repeating a time slot
+        course_data = {
+            "course_name": "Duplicate Slots",
+            "pill_name": "Vitamin D",
+            "time_slots": ["Morning", "Morning"],
+            "start_date": date.today().isoformat(),
+            "duration_days": 1
+        }
+        response = self.make_request("POST", "/courses", course_data)
+        if response and response.status_code == 422:
+            self.log_result("Duplicate Time Slots Validation", True)
+        else:
+            self.log_result("Duplicate Time Slots Validation", False,
+                          f"Expected 422, got {response.status_code if response else 'No response'}")
+
     def cleanup_test_data(self):
         """Clean up test data"""
         print("\n🧹 Cleaning up test data...")
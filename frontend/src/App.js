@@ -87,9 +87,6 @@ class NotificationManager {
         this.intervals.push(timeout);
       }
     });
-
-    // Schedule midnight auto-mark-missed check
-    this.scheduleMidnightCheck();
   }
 
   sendDailyReminders(pendingSchedules) {
@@ -119,39 +116,13 @@ class NotificationManager {
     }
   }
 
-  scheduleMidnightCheck() {
-    const now = new Date();
-    const midnight = new Date();
-    midnight.setHours(24, 0, 0, 0); // Next midnight
-    
-    const timeUntilMidnight = midnight.getTime() - now.getTime();
-
-    const midnightTimeout = setTimeout(() => {
-      this.autoMarkMissedPills();
-      
-      // Set up recurring midnight checks
-      const dailyMidnightCheck = setInterval(() => {
-        this.autoMarkMissedPills();
-      }, 24 * 60 * 60 * 1000);
-      
-      this.intervals.push(dailyMidnightCheck);
-    }, timeUntilMidnight);
-
-    this.intervals.push(midnightTimeout);
-  }
-
-  async autoMarkMissedPills() {
-    try {
-      const response = await axios.post(`${API}/schedules/auto-mark-missed`);
-      if (response.data.updated_count > 0) {
-        this.sendNotification(
-          '⏰ Daily Update',
-          `${response.data.updated_count} missed medication${response.data.updated_count > 1 ? 's' : ''} from previous days have been marked as missed.`,
-          { tag: 'auto-missed' }
-        );
-      }
-    } catch (error) {
-      console.error('Error auto-marking missed pills:', error);
+  notifyMissedPills(updatedCount) {
+    if (updatedCount > 0) {
+      this.sendNotification(
+        '⏰ Daily Update',
+        `${updatedCount} missed medication${updatedCount > 1 ? 's' : ''} from previous days have been marked as missed.`,
+        { tag: 'auto-missed' }
+      );
     }
   }
 
@@ -473,16 +444,21 @@ const CoursesManager = ({ courses, setCourses, onCourseCreated }) => {
   }, [courses]);
 
   const fetchCourseProgress = async () => {
-    const progressData = {};
-    for (const course of courses) {
-      try {
-        const response = await axios.get(`${API}/courses/${course.id}/progress`);
-        progressData[course.id] = response.data;
-      } catch (error) {
-        console.error(`Error fetching progress for course ${course.id}:`, error);
-      }
+    if (courses.length === 0) {
+      setCourseProgress({});
+      return;
+    }
+    try {
+      const ids = courses.map(course => course.id).join(',');
+      const response = await axios.get(`${API}/courses/progress`, { params: { ids } });
+      const progressData = {};
+      response.data.forEach(progress => {
+        progressData[progress.course_id] = progress;
+      });
+      setCourseProgress(progressData);
+    } catch (error) {
+      console.error('Error fetching course progress:', error);
     }
-    setCourseProgress(progressData);
   };
 
   const handleTimeSlotChange = (timeSlot) => {
@@ -1068,47 +1044,52 @@ function App() {
     requestNotificationPermission();
     fetchData();
     
-    // Initialize notification scheduling
-    initializeNotifications();
+    // The server pushes pending reminders on connect and whenever they change
+    const scheduleEvents = new EventSource(`${API}/schedules/stream`);
+    scheduleEvents.addEventListener('reminders', (event) => {
+      notificationManager.scheduleReminders(JSON.parse(event.data));
+    });
+    // Sent after the server's background sweep marks past pending doses as missed
+    scheduleEvents.addEventListener('missed', (event) => {
+      notificationManager.notifyMissedPills(JSON.parse(event.data).updated_count);
+      fetchData();
+    });
     
     // Cleanup on unmount
     return () => {
+      scheduleEvents.close();
       notificationManager.cleanup();
     };
   }, []);
 
-  const initializeNotifications = async () => {
+  const fetchData = async () => {
     try {
-      const response = await axios.get(`${API}/schedules/pending-reminders`);
-      notificationManager.scheduleReminders(response.data);
+      // Fetch all dashboard data in one request
+      const { data } = await axios.get(`${API}/dashboard`);
+
+      setCourses(data.courses);
+      setAppointments(data.appointments);
+      setAnalytics(data.analytics);
+      setTodaySchedules(data.today_schedules);
     } catch (error) {
-      console.error('Error initializing notifications:', error);
+      console.error('Error fetching data:', error);
     }
   };
 
-  const fetchData = async () => {
+  // Stream events only come from the worker serving the stream, so refresh
+  // reminders after our own changes in case another worker handled them
+  const fetchPendingReminders = async () => {
     try {
-      // Fetch all data
-      const [coursesRes, appointmentsRes, analyticsRes, todayRes] = await Promise.all([
-        axios.get(`${API}/courses`),
-        axios.get(`${API}/appointments`),
-        axios.get(`${API}/analytics/overview`),
-        axios.get(`${API}/schedules/today`)
-      ]);
-
-      setCourses(coursesRes.data);
-      setAppointments(appointmentsRes.data);
-      setAnalytics(analyticsRes.data);
-      setTodaySchedules(todayRes.data);
+      const response = await axios.get(`${API}/schedules/pending-reminders`);
+      notificationManager.scheduleReminders(response.data);
     } catch (error) {
-      console.error('Error fetching data:', error);
+      console.error('Error fetching pending reminders:', error);
     }
   };
 
   const onDataUpdate = useCallback(() => {
     fetchData();
-    // Refresh notification scheduling when data changes
-    initializeNotifications();
+    fetchPendingReminders();
   }, []);
 
   const navigation = [
@@ -0,0 +1,122 @@
+from datetime import date
+
+import pytest
+
+import analytics
+
+def frame(*doses):
+    """Doses frame from (ISO date, slot, course id, taken) tuples"""
+    if not doses:
+        return analytics.doses_frame([], [], [], [], [])
+    dates, time_slots, course_ids, taken = zip(*doses)
+    return analytics.doses_frame(
+        [date.fromisoformat(day) for day in dates], time_slots, course_ids,
+        [int(outcome) for outcome in taken], [int(not outcome) for outcome in taken]
+    )
+
+def test_adherence_is_zero_without_resolved_doses():
+    assert analytics.adherence(3, 1) == 75.0
+    assert analytics.adherence(0, 0) == 0.0
+    assert analytics.adherence([1, 0, 2], [2, 0, 0]).tolist() == [33.3, 0.0, 100.0]
+
+def test_daily_counts_fill_days_without_doses():
+    doses = frame(
+        ("2026-01-01", "Morning", "a", True),
+        ("2026-01-01", "Night", "a", False),
+        ("2026-01-03", "Morning", "a", True),
+    )
+    daily = analytics.daily_counts(doses, date(2026, 1, 1), date(2026, 1, 4))
+    assert daily["taken"].tolist() == [1, 0, 1, 0]
+    assert daily["missed"].tolist() == [1, 0, 0, 0]
+
+def test_streaks_skip_days_without_resolved_doses():
+    doses = frame(
+        ("2026-01-01", "Morning", "a", True),
+        # 2026-01-02 has nothing resolved and does not break the run
+        ("2026-01-03", "Morning", "a", True),
+        ("2026-01-04", "Morning", "a", True),
+        ("2026-01-05", "Morning", "a", False),
+        ("2026-01-06", "Morning", "a", True),
+        # 2026-01-07 is empty too, so the current run still ends on 2026-01-06
+    )
+    daily = analytics.daily_counts(doses, date(2026, 1, 1), date(2026, 1, 7))
+    assert analytics.streaks(daily) == {"current_streak": 1, "longest_streak": 3}
+
+def test_streaks_need_every_dose_of_a_day_taken():
+    doses = frame(
+        ("2026-01-01", "Morning", "a", True),
+        ("2026-01-02", "Morning", "a", True),
+        ("2026-01-02", "Night", "a", False),
+    )
+    daily = analytics.daily_counts(doses, date(2026, 1, 1), date(2026, 1, 2))
+    assert analytics.streaks(daily) == {"current_streak": 0, "longest_streak": 1}
+
+def test_streaks_when_every_dose_was_missed():
+    doses = frame(("2026-01-01", "Morning", "a", False), ("2026-01-02", "Morning", "a", False))
+    daily = analytics.daily_counts(doses, date(2026, 1, 1), date(2026, 1, 2))
+    assert analytics.streaks(daily) == {"current_streak": 0, "longest_streak": 0}
+
+def test_empty_frame():
+    doses = frame()
+    daily = analytics.daily_counts(doses, date(2026, 1, 1), date(2026, 1, 3))
+    assert daily["taken"].tolist() == [0, 0, 0]
+    assert analytics.streaks(daily) == {"current_streak": 0, "longest_streak": 0}
+    assert analytics.rolling_adherence(daily, windows=(2,))[2].tolist() == [0.0, 0.0, 0.0]
+    assert analytics.adherence_by(doses, "time_slot").empty
+    assert analytics.course_trends(doses, date(2026, 1, 3)).empty
+
+def test_rolling_adherence_uses_partial_windows_at_the_start():
+    doses = frame(
+        ("2026-01-01", "Morning", "a", True),
+        ("2026-01-01", "Night", "a", False),
+        ("2026-01-02", "Morning", "a", True),
+        ("2026-01-04", "Morning", "a", False),
+    )
+    daily = analytics.daily_counts(doses, date(2026, 1, 1), date(2026, 1, 4))
+    rolling = analytics.rolling_adherence(daily, windows=(1, 2))
+    # The first day has no earlier days, so its window only covers itself
+    assert rolling[1].tolist() == [50.0, 100.0, 0.0, 0.0]
+    assert rolling[2].tolist() == [50.0, 66.7, 100.0, 0.0]
+
+def test_adherence_by_slot():
+    doses = frame(
+        ("2026-01-01", "Morning", "a", True),
+        ("2026-01-02", "Morning", "b", False),
+        ("2026-01-02", "Night", "a", True),
+    )
+    by_slot = analytics.adherence_by(doses, "time_slot")
+    assert by_slot.loc["Morning"].tolist() == [1, 1, 50.0]
+    assert by_slot.loc["Night"].tolist() == [1, 0, 100.0]
+
+def test_grouped_rows_weigh_by_their_counts():
+    doses = analytics.doses_frame(
+        [date(2026, 1, 1), date(2026, 1, 1), date(2026, 1, 2)], ["Morning", "Night", "Morning"], ["a", "a", "b"],
+        [3, 0, 2], [1, 2, 0]
+    )
+    daily = analytics.daily_counts(doses, date(2026, 1, 1), date(2026, 1, 2))
+    assert daily["taken"].tolist() == [3, 2]
+    assert daily["missed"].tolist() == [3, 0]
+    by_course = analytics.adherence_by(doses, "course_id")
+    assert by_course.loc["a"].tolist() == [3, 3, 50.0]
+    assert by_course.loc["b"].tolist() == [2, 0, 100.0]
+
+def test_course_trends_split_at_the_window_boundary():
+    today = date(2026, 1, 31)
+    doses = frame(
+        # With a 7-day window the recent period starts on 2026-01-25 and the previous one on 2026-01-18
+        ("2026-01-25", "Morning", "a", True),
+        ("2026-01-24", "Morning", "a", False),
+        ("2026-01-17", "Morning", "a", False),
+        ("2026-01-18", "Morning", "b", True),
+    )
+    trends = analytics.course_trends(doses, today, window=7)
+    
+    a = trends.loc["a"]
+    assert a["adherence_percentage"] == pytest.approx(33.3)
+    assert (a["recent_adherence"], a["previous_adherence"], a["trend"]) == (100.0, 0.0, 100.0)
+    # A course without doses in a period counts 0% there
+    b = trends.loc["b"]
+    assert (b["recent_adherence"], b["previous_adherence"], b["trend"]) == (0.0, 100.0, -100.0)
+
+def test_dates_between_is_inclusive():
+    assert analytics.dates_between(date(2026, 1, 30), date(2026, 2, 1)) == ["2026-01-30", "2026-01-31", "2026-02-01"]
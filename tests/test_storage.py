@@ -0,0 +1,188 @@
+import asyncio
+from datetime import date, datetime, timezone
+
+import pytest
+
+import storage
+from storage import DOSES_PER_WORD, PillStatus
+
+def course(duration_days, time_slots=("Morning",), start_date="2026-01-01"):
+    return {
+        "id": "c1",
+        "start_date": start_date,
+        "duration_days": duration_days,
+        "time_slots": list(time_slots),
+        "created_at": datetime(2026, 1, 1, tzinfo=timezone.utc),
+    }
+
+def words_with(statuses, words=1):
+    """Bitmap words with the given {dose index: status}, every other dose pending"""
+    packed = [0] * words
+    for index, status in statuses.items():
+        word, position = divmod(index, DOSES_PER_WORD)
+        packed[word] = storage.with_bitmap_status(packed[word], position, status)
+    return packed
+
+def test_empty_bitmap_packs_31_doses_per_word():
+    assert len(storage.empty_bitmap(course(31))["words"]) == 1
+    assert len(storage.empty_bitmap(course(32))["words"]) == 2
+    assert len(storage.empty_bitmap(course(11, ["Morning", "Afternoon", "Night"]))["words"]) == 2
+
+def test_dose_index_orders_by_day_then_slot():
+    two_slots = course(10, ["Morning", "Night"])
+    assert storage.dose_index(two_slots, 0, "Morning") == 0
+    assert storage.dose_index(two_slots, 0, "Night") == 1
+    assert storage.dose_index(two_slots, 15, "Night") == 31
+
+def test_with_bitmap_status_rewrites_only_its_dose():
+    words = words_with({0: "taken", 5: "missed", 30: "missed"})
+    assert [storage.bitmap_status(words, index) for index in (0, 1, 5, 30)] == ["taken", "pending", "missed", "missed"]
+    # The last dose of a word stays clear of the sign bit
+    assert 0 < words[0] < 2 ** 63
+    words[0] = storage.with_bitmap_status(words[0], 5, "pending")
+    assert [storage.bitmap_status(words, index) for index in (0, 5, 30)] == ["taken", "pending", "missed"]
+
+def test_pending_doses_respects_the_range_within_a_word():
+    word = words_with({1: "taken", 2: "missed"})[0]
+    pending = storage.pending_doses(word, 0, 4)
+    assert [position for position in range(DOSES_PER_WORD) if pending >> position * 2 & 1] == [0, 3]
+    assert storage.pending_doses(word, 1, 3) == 0
+    assert storage.pending_doses(word, 4, 4) == 0
+    assert bin(storage.pending_doses(word, 0, DOSES_PER_WORD)).count("1") == DOSES_PER_WORD - 2
+
+def test_count_bitmap_statuses_counts_across_words():
+    words = words_with({0: "taken", 30: "taken", 31: "missed", 40: "taken"}, words=2)
+    assert storage.count_bitmap_statuses(words) == {"taken": 3, "missed": 1}
+
+def test_bitmap_day_counts_and_codes_decode_the_same_statuses():
+    two_slots = course(20, ["Morning", "Night"])
+    words = words_with({0: "taken", 1: "missed", 31: "taken"}, words=2)
+    days = storage.bitmap_day_counts(two_slots, words, 0, 16)
+    assert days["2026-01-01"] == {"taken": 1, "missed": 1}
+    assert days["2026-01-16"] == {"taken": 1, "pending": 1}
+    assert len(days) == 16
+    codes = storage.bitmap_codes(words, 40).tolist()
+    assert codes == [storage.BITMAP_STATUSES.index(storage.bitmap_status(words, index)) for index in range(40)]
+
+# Engine tests against an in-memory MongoDB
+@pytest.fixture
+def bitmap_storage():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    deleted_courses = storage.DeletedCourseIds(db, refresh=30)
+    return storage.create_schedule_storage("bitmap", db, storage.DateStorage("iso"), deleted_courses)
+
+def add_course(engine, raw_course):
+    async def add():
+        await engine.db.pill_courses.insert_one(dict(raw_course))
+        await engine.add_course(raw_course)
+    asyncio.run(add())
+
+def stored_words(engine):
+    async def load():
+        return (await engine.load_bitmaps(["c1"]))["c1"]
+    return asyncio.run(load())
+
+def test_mark_missed_flips_pending_doses_across_word_boundaries(bitmap_storage):
+    add_course(bitmap_storage, course(40))
+    asyncio.run(bitmap_storage.set_statuses({"c1:30:Morning": PillStatus.TAKEN}, {}))
+    
+    async def sweep():
+        return [marked async for marked in bitmap_storage.mark_missed(date(2026, 2, 5))]
+    marked = asyncio.run(sweep())
+    
+    assert sum(sum(counts.values()) for counts in marked) == 34
+    words = stored_words(bitmap_storage)
+    assert [storage.bitmap_status(words, index) for index in (0, 29, 30, 31, 34)] == ["missed", "missed", "taken", "missed", "missed"]
+    assert [storage.bitmap_status(words, index) for index in (35, 39)] == ["pending", "pending"]
+    swept = asyncio.run(bitmap_storage.db.pill_courses.find_one({"id": "c1"}))
+    assert swept["missed_through"] == "2026-02-05"
+
+def test_mark_words_missed_retries_a_word_changed_since_it_was_read(bitmap_storage):
+    raw_course = course(40)
+    add_course(bitmap_storage, raw_course)
+    # Another request takes dose 3 after the sweep loaded the bitmap
+    stale = [0, 0]
+    asyncio.run(bitmap_storage.set_statuses({"c1:3:Morning": PillStatus.TAKEN}, {}))
+    
+    marked = asyncio.run(bitmap_storage.mark_words_missed(raw_course, stale, 0, 10))
+    
+    assert sum(marked.values()) == 9
+    assert "2026-01-04" not in marked
+    words = stored_words(bitmap_storage)
+    assert storage.bitmap_status(words, 3) == "taken"
+    assert storage.bitmap_status(words, 10) == "pending"
+
+def test_set_statuses_rewrites_every_word_of_a_course_in_one_guarded_write(bitmap_storage):
+    add_course(bitmap_storage, course(40))
+    results = {}
+    landed = asyncio.run(bitmap_storage.set_statuses(
+        {"c1:1:Morning": PillStatus.TAKEN, "c1:35:Morning": PillStatus.MISSED, "c1:2:Morning": PillStatus.PENDING},
+        results
+    ))
+    assert results == {"c1:1:Morning": "updated", "c1:35:Morning": "updated", "c1:2:Morning": "unchanged"}
+    assert [(schedule["id"], previous) for schedule, previous in landed] == [
+        ("c1:1:Morning", "pending"), ("c1:35:Morning", "pending")
+    ]
+    words = stored_words(bitmap_storage)
+    assert [storage.bitmap_status(words, index) for index in (1, 2, 35)] == ["taken", "pending", "missed"]
+
+def test_set_statuses_reports_conflicts_when_a_word_changed_meanwhile(bitmap_storage, monkeypatch):
+    add_course(bitmap_storage, course(40))
+    asyncio.run(bitmap_storage.set_statuses({"c1:35:Morning": PillStatus.MISSED}, {}))
+    load_bitmaps = bitmap_storage.load_bitmaps
+    reads = []
+    
+    async def stale_then_fresh(course_ids):
+        # The first read predates the write above
+        reads.append(course_ids)
+        return {"c1": [0, 0]} if len(reads) == 1 else await load_bitmaps(course_ids)
+    monkeypatch.setattr(bitmap_storage, "load_bitmaps", stale_then_fresh)
+    
+    results = {}
+    landed = asyncio.run(bitmap_storage.set_statuses(
+        {"c1:1:Morning": PillStatus.TAKEN, "c1:36:Morning": PillStatus.TAKEN}, results
+    ))
+    
+    assert landed == []
+    assert results == {"c1:1:Morning": "conflict", "c1:36:Morning": "conflict"}
+    words = stored_words(bitmap_storage)
+    assert [storage.bitmap_status(words, index) for index in (1, 35, 36)] == ["pending", "missed", "pending"]
+
+def test_unknown_storage_modes_fall_back_to_materialized():
+    engine = storage.create_schedule_storage("unknown", None, storage.DateStorage("iso"), None)
+    assert isinstance(engine, storage.MaterializedStorage)
+    assert storage.schedule_key("c1", 3, "Night") == "c1:3:Night"
+    assert storage.parse_schedule_key("c1:3:Night") == ("c1", 3, storage.TimeSlot.NIGHT)
+    assert storage.parse_schedule_key("legacy-uuid") is None
+
+def test_unknown_date_storage_modes_are_rejected():
+    with pytest.raises(ValueError, match="iso, native, migrating"):
+        storage.DateStorage("isoformat")
+
+def test_bitmap_storage_counts_its_bitmaps_as_stored(bitmap_storage):
+    add_course(bitmap_storage, course(40))
+    assert asyncio.run(bitmap_storage.count_stored(["c1", "c2"])) == 1
+
+def test_sweeps_skip_courses_swept_past_their_end(bitmap_storage):
+    add_course(bitmap_storage, course(10))
+    
+    async def sweep(before):
+        return [marked async for marked in bitmap_storage.mark_missed(before)]
+    assert sum(sum(counts.values()) for counts in asyncio.run(sweep(date(2026, 1, 5)))) == 4
+    assert len(asyncio.run(bitmap_storage.find_courses_to_sweep(date(2026, 1, 20)))) == 1
+    assert sum(sum(counts.values()) for counts in asyncio.run(sweep(date(2026, 1, 20)))) == 6
+    
+    swept = asyncio.run(bitmap_storage.db.pill_courses.find_one({"id": "c1"}))
+    assert swept["end_date"] == "2026-01-11"
+    assert asyncio.run(bitmap_storage.find_courses_to_sweep(date(2026, 1, 21))) == []
+
+def test_engines_must_implement_the_whole_interface():
+    class PartialStorage(storage.ScheduleStorage):
+        async def add_course(self, course):
+            pass
+    
+    with pytest.raises(TypeError, match="mark_missed"):
+        PartialStorage(None, storage.DateStorage("iso"), None)
+    for engine in storage.SCHEDULE_STORAGES.values():
+        assert not engine.__abstractmethods__